@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+from tornado.websocket import websocket_connect
+from tornado.httpclient import HTTPRequest
+from bidBook import BidBook
+from checkpoint import Checkpointer
+from gameSession import GameSession, loadProfile, windProfile, solarProfile
+from gridDispatch import gridDispatch, dispatchCache, gp
+import mainApp
+
+# timings of the hot paths saved as a JSON baseline, and compared with an earlier baseline to catch regressions
+# every result is the time of one call in seconds, summarized over repeated runs
+def measure(fn, repeat=7, number=None):
+    if number is None:
+        # run fast functions many times per repeat so that the timer resolution and noise do not dominate
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            if time.perf_counter() - start >= 0.05:
+                break
+            number *= 2
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return summarize(times)
+
+def summarize(times):
+    return {'median': float(np.median(times)), 'min': float(np.min(times)), 'p95': float(np.percentile(times, 95)), 'n': len(times)}
+
+def randomBids(n, rng):
+    book = BidBook(n)
+    for i in range(n):
+        book.add(float(rng.integers(10, 200)), float(rng.integers(-20, 120)), int(rng.integers(0, 2)), i % 6 + 1)
+    return book
+
+def benchDispatch(results, sizes, backends):
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        bids = randomBids(n, rng)
+        # loads that the bids can always meet, with some congestion
+        loads = [0.4 * bids.amount.sum(), 0.1 * bids.amount.sum()]
+        for backend in backends:
+            try:
+                results[f'dispatch.{backend}.bids={n}'] = measure(lambda: gridDispatch(bids, loads, 200, backend=backend))
+            except gp.GurobiError as e:
+                # e.g. a size-limited license
+                print(f'dispatch.{backend}.bids={n} skipped: {e}', file=sys.stderr)
+
+def benchClearing(results, roles):
+    def playRound(cached=False):
+        if not cached:
+            # every repeat plays the same seeded bids, which the process-wide dispatch cache would answer
+            dispatchCache.results.clear()
+        game = GameSession('bench', roles, seed=0)
+        while game.period <= game.numPeriods:
+            game.clearMarket()
+    results['clearMarket.round'] = measure(playRound)
+    # the same round with every dispatch answered by the cache
+    results['clearMarket.round.cached'] = measure(lambda: playRound(cached=True))
+    game = GameSession('bench', roles, seed=0)
+    game.clearMarket()
+    genSol = [(i, 100.0) for i in range(1, 7)]
+    lmp = [20.0, 25.0]
+    def settle():
+        game.ledger.periods = 0
+        game.ledger.settle(genSol, lmp)
+    results['settle'] = measure(settle)
+
+def benchRendering(results, roles, horizons):
+    for periods in horizons:
+        reps = -(-periods // len(loadProfile[0]))
+        tile = lambda profile: np.tile(profile, reps)[:periods]
+        game = GameSession('bench', roles, seed=0, loadProfile={l: tile(p) for l, p in loadProfile.items()},
+                           windProfile=tile(windProfile), solarProfile=tile(solarProfile))
+        while game.period <= game.numPeriods:
+            game.clearMarket()
+        # renderings of showMarketInfo and showMarketRes, without the render cache
+        results[f'render.marketInfo.periods={periods}'] = measure(lambda: mainApp.renderForecast(game), repeat=3, number=1)
+        results[f'render.marketRes.periods={periods}'] = measure(lambda: [(mainApp.renderBids(game, p), mainApp.dispatchTable(game, p)) for p in range(1, game.period)], repeat=3, number=1)
+
+# simulated browser: speaks the PyWebIO websocket protocol
+class Client:
+    def __init__(self, port):
+        self.port = port
+        self.msgs = []
+
+    async def connect(self):
+        self.ws = await websocket_connect(HTTPRequest(f'ws://localhost:{self.port}/?app=index', headers={'Origin': f'http://localhost:{self.port}'}))
+
+    async def until(self, match, timeout=60):
+        # read messages until one of them matches, and return it
+        while True:
+            msg = await asyncio.wait_for(self.ws.read_message(), timeout)
+            if msg is None:
+                raise ConnectionError('The server closed the session.')
+            msg = json.loads(msg)
+            self.msgs.append(msg)
+            if match(msg):
+                return msg
+
+    async def submit(self, value):
+        # answer the next single input, which PyWebIO sends as a group of one
+        form = await self.until(lambda m: m['command'] == 'input_group')
+        await self.ws.write_message(json.dumps({'event': 'from_submit', 'task_id': form['task_id'], 'data': {form['spec']['inputs'][0]['name']: value}}))
+        return form
+
+    async def click(self, label):
+        for msg in reversed(self.msgs):
+            if msg['command'] == 'output' and msg['spec'].get('type') == 'buttons':
+                for button in msg['spec']['buttons']:
+                    if button['label'] == label:
+                        await self.ws.write_message(json.dumps({'event': 'callback', 'task_id': msg['spec']['callback_id'], 'data': button['value']}))
+                        return
+        raise KeyError(label)
+
+def isText(content):
+    return lambda m: m['command'] == 'output' and m['spec'].get('type') == 'text' and content in m['spec'].get('content', '')
+
+def isTable(m):
+    return m['command'] == 'output' and m['spec'].get('type') == 'table'
+
+async def playRoom(port, code, players, timing):
+    gm = Client(port)
+    await gm.connect()
+    await gm.submit(code)
+    await gm.submit(1000)
+    await gm.until(lambda m: m['command'] == 'output' and m['spec'].get('type') == 'buttons')
+    clients = []
+    for gameID in players:
+        client = Client(port)
+        await client.connect()
+        await client.submit(code)
+        await client.submit(gameID)
+        await client.until(isText('Market Period: 1'))
+        clients.append(client)
+    periods = len(loadProfile[0])
+    for period in range(1, periods + 1):
+        for client in clients:
+            start = time.perf_counter()
+            await client.click('Make Bid')
+            form = await client.until(lambda m: m['command'] == 'input_group')
+            # offer the whole capacity proposed by the form at a flat price
+            capacity = form['spec']['inputs'][0]['value']
+            data = {i['name']: 0 for i in form['spec']['inputs']}
+            data.update({'gen1': capacity, 'price1': 20})
+            await client.ws.write_message(json.dumps({'event': 'from_submit', 'task_id': form['task_id'], 'data': data}))
+            timing['bid'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await gm.click('Clear Market')
+        # the game master sees the result tables of every period cleared so far
+        for _ in range(period):
+            await gm.until(isTable)
+        timing['clear'].append(time.perf_counter() - start)
+        if period < periods:
+            for client in clients:
+                await client.until(isText(f'Market Period: {period + 1}'))
+            timing['playerUpdate'].append(time.perf_counter() - start)
+    for client in clients + [gm]:
+        client.ws.close()
+
+def freePort():
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        return s.getsockname()[1]
+
+async def waitServer(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('localhost', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError('The game server did not start.')
+
+def benchSessions(results, rooms, players):
+    port = freePort()
+    server = subprocess.Popen([sys.executable, 'mainApp.py', str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    codes = [f'bench-{os.getpid()}-{i}' for i in range(rooms)]
+    timing = {'bid': [], 'clear': [], 'playerUpdate': []}
+    async def run():
+        await waitServer(port)
+        start = time.perf_counter()
+        await asyncio.gather(*[playRoom(port, code, players, timing) for code in codes])
+        return time.perf_counter() - start
+    try:
+        total = asyncio.run(run())
+    finally:
+        server.terminate()
+        server.wait()
+        # the server checkpoints every room, the benchmark rooms must not be restored by the next server
+        checkpoint = Checkpointer('./checkpoints')
+        for code in codes:
+            if os.path.exists(checkpoint.path(code)):
+                os.remove(checkpoint.path(code))
+    for name, times in timing.items():
+        results[f'session.{name}'] = summarize(times)
+    results['session.total'] = summarize([total])
+    results['session.clearsPerSecond'] = {'median': rooms * len(loadProfile[0]) / total, 'n': 1, 'higherIsBetter': True}
+
+def compare(results, baseline, tolerance):
+    # a result regresses when it is slower than the baseline by more than the tolerance; repeated timings are
+    # compared by their best run, which is the least sensitive to other load on the machine
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        key = 'min' if 'min' in result and 'min' in baseline[name] else 'median'
+        old = baseline[name][key]
+        new = result[key]
+        ratio = new / old if old else float('inf')
+        if result.get('higherIsBetter'):
+            ratio = 1 / ratio if ratio else float('inf')
+        flag = 'REGRESSION' if ratio > 1 + tolerance else ''
+        print(f'{name:45s} {old:12.6g} {new:12.6g} {ratio:8.2f} {flag}', file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark clearing, settlement, rendering and game sessions.')
+    parser.add_argument('--out', default='benchResults.json')
+    parser.add_argument('--compare', help='baseline written by an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown against the baseline, as a fraction')
+    parser.add_argument('--bids', type=int, nargs='+', default=[6, 30, 100, 1000, 10000], help='bid counts of the dispatch benchmark')
+    parser.add_argument('--periods', type=int, nargs='+', default=[4, 12, 48], help='cleared periods of the rendering benchmark')
+    parser.add_argument('--rooms', type=int, default=4, help='games played at the same time against the local server')
+    parser.add_argument('--no-session', action='store_true', help='skip the end-to-end session benchmark')
+    args = parser.parse_args()
+    roles = json.load(open('./generators.json'))
+    results = {}
+    benchDispatch(results, args.bids, ['merit', 'gurobi'] if gp is not None else ['merit'])
+    benchClearing(results, roles)
+    benchRendering(results, roles, args.periods)
+    if not args.no_session:
+        # game IDs 1 to 5 are the players, see gameID_role
+        benchSessions(results, args.rooms, [1, 2, 3, 4, 5])
+    report = {
+        'settings': {'python': platform.python_version(), 'machine': platform.machine(), 'processor': platform.processor(), 'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+        'results': results
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f'{len(results)} benchmarks written to {args.out}', file=sys.stderr)
+    if args.compare:
+        regressions = compare(results, json.load(open(args.compare))['results'], args.tolerance)
+        if regressions:
+            print(f'{len(regressions)} regressions: {", ".join(regressions)}', file=sys.stderr)
+            sys.exit(1)
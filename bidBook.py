@@ -0,0 +1,99 @@
+import numpy as np
+
+class bid:
+    def __init__(self, amount, price, location, roleID):
+        self.amount = amount
+        self.price = price
+        self.loc = location
+        self.id = roleID
+    def __lt__(self, other):
+        return self.price < other.price
+
+# bid segments of one period stored as numpy columns (one row per price-quantity segment), with an index
+# by role and a cached price-sorted order; amount, price, loc and role are views of the filled rows
+class BidBook:
+    def __init__(self, capacity=8):
+        self.size = 0
+        self.amountCol = np.zeros(capacity)
+        self.priceCol = np.zeros(capacity)
+        self.locCol = np.zeros(capacity, dtype=int)
+        self.roleCol = np.zeros(capacity, dtype=int)
+        self.roleIdx = {}
+        self.order = None
+        self.locOrder = {}
+
+    @classmethod
+    def fromBids(cls, bids):
+        book = cls(max(len(bids), 1))
+        for b in bids:
+            book.add(b.amount, b.price, b.loc, b.id)
+        return book
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def amount(self):
+        return self.amountCol[:self.size]
+
+    @property
+    def price(self):
+        return self.priceCol[:self.size]
+
+    @property
+    def loc(self):
+        return self.locCol[:self.size]
+
+    @property
+    def role(self):
+        return self.roleCol[:self.size]
+
+    def add(self, amount, price, loc, roleID):
+        if self.size == len(self.amountCol):
+            # grow all columns by doubling so that appends stay amortized O(1)
+            for name in ['amountCol', 'priceCol', 'locCol', 'roleCol']:
+                col = getattr(self, name)
+                grown = np.zeros(2 * len(col), dtype=col.dtype)
+                grown[:self.size] = col
+                setattr(self, name, grown)
+        i = self.size
+        self.amountCol[i] = amount
+        self.priceCol[i] = price
+        self.locCol[i] = loc
+        self.roleCol[i] = roleID
+        self.roleIdx.setdefault(roleID, []).append(i)
+        self.size += 1
+        self.order = None
+        self.locOrder = {}
+
+    def hasRole(self, roleID):
+        return roleID in self.roleIdx
+
+    def roleAmount(self, roleID):
+        return self.amountCol[self.roleIdx.get(roleID, [])].sum()
+
+    def rolePrices(self, roleID):
+        return self.priceCol[self.roleIdx.get(roleID, [])]
+
+    def sortedIdx(self):
+        # row indices in merit order, computed once per change of the book
+        if self.order is None:
+            self.order = np.argsort(self.price, kind='stable')
+        return self.order
+
+    def locationIdx(self, loc):
+        # merit order of one location, filtered from the sorted book instead of sorted again
+        if loc not in self.locOrder:
+            order = self.sortedIdx()
+            self.locOrder[loc] = order[self.loc[order] == loc]
+        return self.locOrder[loc]
+
+    def supplyCurve(self, loc=None):
+        # stepped supply curve: prices in merit order and the accumulated bid amount up to each of them
+        order = self.sortedIdx() if loc is None else self.locationIdx(loc)
+        return self.price[order], np.cumsum(self.amount[order])
+
+def asBidBook(bids):
+    if isinstance(bids, BidBook):
+        return bids
+    return BidBook.fromBids(bids)
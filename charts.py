@@ -0,0 +1,52 @@
+import importlib.util
+import json
+import os
+import uuid
+
+# plotly figures emitted as JSON straight from the arrays, without building plotly objects or DataFrames
+# plotly.js itself is served once by the game server (see plotlyDir) and loaded by the page through require.js,
+# so every figure only carries its own data
+plotlyDir = os.path.join(importlib.util.find_spec('plotly').submodule_search_locations[0], 'package_data')
+plotlyUrl = '/plotly/plotly.min'
+
+# plotly.colors.DEFAULT_PLOTLY_COLORS
+colors = ['rgb(31, 119, 180)', 'rgb(255, 127, 14)', 'rgb(44, 160, 44)', 'rgb(214, 39, 40)', 'rgb(148, 103, 189)']
+
+def toList(value):
+    return value.tolist() if hasattr(value, 'tolist') else list(value)
+
+def figureHtml(data, layout):
+    div = f'plot-{uuid.uuid4().hex}'
+    spec = json.dumps({'data': data, 'layout': layout}, separators=(',', ':'))
+    return (f'<div id="{div}" style="height:450px;"></div>'
+            f'<script>require.config({{paths: {{plotly: "{plotlyUrl}"}}}});'
+            f'require(["plotly"], function(Plotly) {{var fig = {spec}; Plotly.newPlot("{div}", fig.data, fig.layout, {{responsive: true}});}});</script>')
+
+def axis(title, range=None):
+    ax = {'title': {'text': title}}
+    if range is not None:
+        ax['range'] = range
+    return ax
+
+def bar(x, series, xTitle, yTitle, yRange=None, highlight=None):
+    # stacked bars, series is a list of (name, values, color); the bars at x == highlight are opaque
+    x = toList(x)
+    opacity = [1 if v == highlight else 0.5 for v in x]
+    data = [{'type': 'bar', 'name': name, 'x': x, 'y': toList(y), 'marker': {'color': color, 'opacity': opacity}} for name, y, color in series]
+    return figureHtml(data, {'barmode': 'relative', 'xaxis': axis(xTitle), 'yaxis': axis(yTitle, yRange)})
+
+def line(series, xTitle, yTitle, shape='linear', hlines=(), vlines=(), fontSize=None):
+    # step or straight lines, series is a list of (name, x, y); hlines and vlines are lists of
+    # (position, label, color, side) drawn dashed across the whole plot
+    data = [{'type': 'scatter', 'mode': 'lines', 'name': name, 'x': toList(x), 'y': toList(y), 'line': {'shape': shape}} for name, x, y in series]
+    shapes = []
+    annotations = []
+    font = {'size': fontSize} if fontSize else {}
+    for y, label, color, side in hlines:
+        shapes.append({'type': 'line', 'xref': 'paper', 'x0': 0, 'x1': 1, 'y0': y, 'y1': y, 'line': {'dash': 'dash', 'color': color}})
+        annotations.append({'text': label, 'xref': 'paper', 'x': 0 if side == 'left' else 1, 'xanchor': side, 'y': y, 'yanchor': 'bottom', 'showarrow': False, 'font': font})
+    for x, label, color, side in vlines:
+        shapes.append({'type': 'line', 'yref': 'paper', 'y0': 0, 'y1': 1, 'x0': x, 'x1': x, 'line': {'dash': 'dash', 'color': color}})
+        annotations.append({'text': label, 'yref': 'paper', 'y': 1, 'yanchor': 'top', 'x': x, 'xanchor': side, 'showarrow': False, 'font': font})
+    layout = {'xaxis': axis(xTitle), 'yaxis': axis(yTitle), 'shapes': shapes, 'annotations': annotations, 'showlegend': len(series) > 1}
+    return figureHtml(data, layout)
@@ -0,0 +1,62 @@
+import os
+import pickle
+import threading
+from urllib.parse import quote, unquote
+
+# snapshots of live games for crash recovery, one file per room in a compact pickle of numpy arrays
+# the state is serialized on the caller so it is consistent, the file is written by a background thread
+# and swapped in atomically, so a crash at any time leaves either the previous or the new snapshot
+class Checkpointer:
+    def __init__(self, directory='./checkpoints'):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # latest unwritten snapshot of every game, older ones are simply overwritten
+        self.pending = {}
+        self.writing = 0
+        self.condition = threading.Condition()
+        self.writer = threading.Thread(target=self.write, daemon=True)
+        self.writer.start()
+
+    def path(self, code):
+        return os.path.join(self.directory, quote(code, safe='') + '.pkl')
+
+    def save(self, game):
+        data = pickle.dumps(game.toState(), protocol=pickle.HIGHEST_PROTOCOL)
+        with self.condition:
+            self.pending[game.code] = data
+            self.condition.notify_all()
+
+    def write(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                code, data = self.pending.popitem()
+                self.writing += 1
+            try:
+                path = self.path(code)
+                tmp = path + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, path)
+            finally:
+                with self.condition:
+                    self.writing -= 1
+                    self.condition.notify_all()
+
+    def flush(self):
+        # wait until every snapshot taken so far is on disk
+        with self.condition:
+            while self.pending or self.writing:
+                self.condition.wait()
+
+    def load(self):
+        # state of every game found in the directory, keyed by room code
+        states = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    states[unquote(name[:-len('.pkl')])] = pickle.load(f)
+        return states
@@ -0,0 +1,101 @@
+import numpy as np
+import scipy.sparse as sp
+from bidBook import asBidBook
+from metrics import metrics
+
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:
+    gp = None
+
+# defaults for roles of generators.json without 'Ramp Rate (MW/period)' or 'Minimum Generation (MW)',
+# as fractions of the capacity; only units with a not-dispatched penalty have a minimum generation
+defaultRamp = {'coal': 0.5}
+defaultMinGen = 0.25
+
+# multi-period clearing of the two-bus grid: a window of periods is co-optimized in one MIP where units with a
+# not-dispatched penalty decide whether to run (at least their minimum generation) or pay the penalty, and
+# every unit respects its ramp limit between periods; only the first period of the window is settled, then
+# the window rolls forward and the commitments of the previous solution are used as the MIP start
+class RollingHorizon:
+    def __init__(self, roles, window=24):
+        if gp is None:
+            raise ImportError('gurobipy is required for the rolling-horizon clearing.')
+        from gridDispatch import getEnv
+        self.env = getEnv()
+        self.window = window
+        roleIDs = sorted(int(i) for i in roles.keys())
+        self.roleNum = len(roleIDs)
+        role = [roles[str(i)] for i in roleIDs]
+        capacity = np.array([r.get('Capacity (MW)', r.get('Nameplate Capacity (Maximum possible generation MW)', 0)) for r in role], dtype=float)
+        self.penalty = np.array([r.get('Not-dispatched Penalty (per period)', 0) if r['Fuel'] == 'coal' else 0 for r in role], dtype=float)
+        self.ramp = np.array([r.get('Ramp Rate (MW/period)', defaultRamp.get(r['Fuel'], 1) * capacity[j]) for j, r in enumerate(role)], dtype=float)
+        self.minGen = np.array([r.get('Minimum Generation (MW)', defaultMinGen * capacity[j] if self.penalty[j] > 0 else 0) for j, r in enumerate(role)], dtype=float)
+        self.committed = np.flatnonzero(self.penalty > 0)
+        self.ramped = np.flatnonzero(self.ramp < capacity)
+        # commitments of the last solution, by period of the window
+        self.lastCommit = None
+
+    @metrics.timed()
+    def solve(self, books, loads, transLimit, prevGen=None):
+        # books are the bids of the periods of the window, the first one is the period being cleared and the
+        # others are forecasts; loads is (periods x 2) and prevGen the dispatch of every role in the last period
+        books = [asBidBook(b) for b in books]
+        T = len(books)
+        loads = np.asarray(loads, dtype=float)
+        rows = np.cumsum([0] + [len(b) for b in books])
+        amount = np.concatenate([b.amount for b in books])
+        price = np.concatenate([b.price for b in books])
+        loc = np.concatenate([b.loc for b in books])
+        role = np.concatenate([b.role for b in books]) - 1
+        period = np.repeat(np.arange(T), np.diff(rows))
+        n = len(amount)
+        m = gp.Model('rollingHorizon', env=self.env)
+        g = m.addMVar(n, lb=0, ub=amount, obj=price)
+        flow = m.addMVar(T, lb=-transLimit, ub=transLimit)
+        # power balance of every (period, location), the flow goes from location 0 to location 1
+        atLoc = sp.csr_matrix((np.ones(n), (2 * period + loc, np.arange(n))), shape=(2 * T, n))
+        flowLoc = sp.csr_matrix((np.tile([-1.0, 1.0], T), (np.arange(2 * T), np.repeat(np.arange(T), 2))), shape=(2 * T, T))
+        balance = m.addConstr(atLoc @ g + flowLoc @ flow == loads.reshape(-1))
+        # total generation of every role in every period, (periods * roles) rows
+        roleGen = sp.csr_matrix((np.ones(n), (period * self.roleNum + role, np.arange(n))), shape=(T * self.roleNum, n))
+        if len(self.committed):
+            u = m.addMVar((T, len(self.committed)), vtype=GRB.BINARY, obj=-np.tile(self.penalty[self.committed], (T, 1)))
+            sel = (np.arange(T)[:, None] * self.roleNum + self.committed).reshape(-1)
+            committedGen = roleGen[sel]
+            capacity = np.array([[b.roleAmount(j + 1) for j in self.committed] for b in books]).reshape(-1)
+            m.addConstr(committedGen @ g <= capacity * u.reshape(-1))
+            m.addConstr(committedGen @ g >= np.tile(self.minGen[self.committed], T) * u.reshape(-1))
+            if self.lastCommit is not None:
+                # the previous window started one period earlier
+                start = np.ones((T, len(self.committed)))
+                shifted = self.lastCommit[1:T + 1]
+                start[:len(shifted)] = shifted
+                u.Start = start
+        for j in self.ramped:
+            sel = np.arange(T) * self.roleNum + j
+            jGen = roleGen[sel]
+            if T > 1:
+                step = (jGen[1:] - jGen[:-1]).tocsr()
+                m.addConstr(step @ g <= self.ramp[j])
+                m.addConstr(step @ g >= -self.ramp[j])
+            if prevGen is not None:
+                m.addConstr(jGen[0] @ g <= prevGen[j] + self.ramp[j])
+                m.addConstr(jGen[0] @ g >= prevGen[j] - self.ramp[j])
+        m.ObjCon = T * self.penalty.sum()
+        m.ModelSense = GRB.MINIMIZE
+        m.optimize()
+        if m.Status != GRB.OPTIMAL:
+            raise ValueError('Bids are not enough to meet the load.')
+        gen = g.X
+        if len(self.committed):
+            self.lastCommit = np.round(u.X)
+            # prices come from the LP with the commitments fixed
+            fixed = m.fixed()
+            fixed.optimize()
+            pi = np.array(fixed.getAttr('Pi', fixed.getConstrs()[:2 * T]))
+        else:
+            pi = balance.Pi
+        genSol = [(int(books[0].role[i]), float(gen[i])) for i in range(rows[1])]
+        return genSol, pi[:2].tolist()
@@ -0,0 +1,128 @@
+import queue
+import sqlite3
+import threading
+
+# append-only history of played games in one SQLite file with typed columns
+# rows are queued by the game server and written in batches by a background thread, off the request path
+schema = [
+    '''CREATE TABLE IF NOT EXISTS bids (
+        game TEXT, started REAL, round INTEGER, period INTEGER, role INTEGER, segment INTEGER,
+        location INTEGER, amount REAL, price REAL)''',
+    '''CREATE TABLE IF NOT EXISTS results (
+        game TEXT, started REAL, round INTEGER, period INTEGER, role INTEGER, player INTEGER,
+        fuel TEXT, location INTEGER, bidAmount REAL, dispatch REAL, lmp REAL,
+        revenue REAL, profit REAL, penalty REAL, taxCredit REAL)''',
+    '''CREATE TABLE IF NOT EXISTS prices (
+        game TEXT, started REAL, round INTEGER, period INTEGER, location INTEGER, lmp REAL)''',
+    'CREATE INDEX IF NOT EXISTS resultsGame ON results (game, started, round, period)',
+    'CREATE INDEX IF NOT EXISTS bidsGame ON bids (game, started, round, period)'
+]
+
+class GameHistory:
+    def __init__(self, path='./gameHistory.db', batchSize=500):
+        self.path = path
+        self.batchSize = batchSize
+        self.queue = queue.Queue()
+        conn = self.connect()
+        # WAL lets the analysis queries read while the writer appends
+        conn.execute('PRAGMA journal_mode=WAL')
+        with conn:
+            for statement in schema:
+                conn.execute(statement)
+        conn.close()
+        self.writer = threading.Thread(target=self.write, daemon=True)
+        self.writer.start()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # queue the bids and settlement of one cleared period of a game
+    def record(self, game, period):
+        ledger = game.ledger
+        t = period - 1
+        key = (game.code, game.started, game.round, period)
+        bids = []
+        book = game.bids_period[period]
+        for roleID, rows in book.roleIdx.items():
+            for segment, i in enumerate(rows):
+                bids.append(key + (int(roleID), segment, int(book.locCol[i]), float(book.amountCol[i]), float(book.priceCol[i])))
+        results = []
+        for i in range(ledger.roleNum):
+            roleID = i + 1
+            role = game.roles[str(roleID)]
+            results.append(key + (roleID, game.roleID_gameID.get(roleID), role['Fuel'], int(ledger.loc[i]), float(book.roleAmount(roleID)),
+                                  float(ledger.dispatch[i, t]), float(ledger.lmp[i, t]), float(ledger.revenue[i, t]), float(ledger.profit[i, t]),
+                                  float(ledger.penalty[i, t]), float(ledger.taxCredit[i, t])))
+        prices = [key + (l, float(lmp)) for l, lmp in enumerate(ledger.clearingPrice[t])]
+        self.queue.put(('bids', bids))
+        self.queue.put(('results', results))
+        self.queue.put(('prices', prices))
+
+    def write(self):
+        conn = self.connect()
+        while True:
+            batch = [self.queue.get()]
+            # drain whatever else is waiting so that one transaction covers many periods
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    for table, rows in batch:
+                        if rows:
+                            conn.executemany(f'INSERT INTO {table} VALUES ({", ".join("?" * len(rows[0]))})', rows)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self):
+        # wait until every queued row is written
+        self.queue.join()
+
+    # analysis API, every reader returns a DataFrame and can be narrowed to some games and rounds
+    def query(self, sql, params=()):
+        # pandas is only needed for the analysis, not by the game server that records the history
+        import pandas as pd
+        conn = self.connect()
+        try:
+            return pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+
+    def select(self, table, games=None, round=None):
+        sql = f'SELECT * FROM {table}'
+        where = []
+        params = []
+        if games is not None:
+            games = [games] if isinstance(games, str) else list(games)
+            where.append(f'game IN ({", ".join("?" * len(games))})')
+            params += games
+        if round is not None:
+            where.append('round = ?')
+            params.append(round)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        return self.query(sql + ' ORDER BY started, game, round, period', params)
+
+    def bids(self, games=None, round=None):
+        return self.select('bids', games, round)
+
+    def results(self, games=None, round=None):
+        return self.select('results', games, round)
+
+    def prices(self, games=None, round=None):
+        return self.select('prices', games, round)
+
+    def profitByRole(self, round=None):
+        # total profit of every role in every game, one row per (game, round, role)
+        sql = 'SELECT game, started, round, role, fuel, SUM(dispatch) AS dispatch, SUM(revenue) AS revenue, SUM(profit) AS profit FROM results'
+        params = []
+        if round is not None:
+            sql += ' WHERE round = ?'
+            params.append(round)
+        return self.query(sql + ' GROUP BY game, started, round, role ORDER BY started, game, round, role', params)
+
+    def games(self):
+        return self.query("SELECT game, started, MAX(round) AS rounds, COUNT(DISTINCT round || '-' || period) AS periods FROM prices GROUP BY game, started ORDER BY started")
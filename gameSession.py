@@ -0,0 +1,300 @@
+import asyncio
+import threading
+import time
+import numpy as np
+from gridDispatch import DispatchModel, dispatchCache
+from renderCache import renderCache
+from bidBook import BidBook
+from ledger import SettlementLedger
+from network import Network, networkDispatch
+from profiles import Profiles
+import commitment
+from commitment import RollingHorizon
+from metrics import metrics
+
+gameID_role = {
+    1: {
+        'round 1': 1,
+        'round 2': 2
+    },
+    2: {
+        'round 1': 2,
+        'round 2': 4
+    },
+    3: {
+        'round 1': 3,
+        'round 2': 1
+    },
+    4: {
+        'round 1': 4,
+        'round 2': 3
+    },
+    5: {
+        'round 1': 5,
+        'round 2': 6
+    },
+
+}
+
+# buses and lines of the grid, the two-bus grid is cleared by gridDispatch with the transLimit of each round
+network = Network.load('./network.json')
+locIdx_name = dict(enumerate(network.busName))
+# renewable generation and load profiles, one value per period of a round (see profiles.py for the file formats)
+profiles = Profiles.load('./profiles.csv', network.busName)
+windProfile = profiles.wind
+solarProfile = profiles.solar
+loadProfile = profiles.loadProfile()
+transLimit = {1: 200, 2: 5000}
+# renewable tax credit
+renewCredit = 30
+
+# features seen by a bidding policy, shared by MarketEnv and the bots of GameSession so that a policy trained
+# on one can bid in the other; every argument has a leading batch dimension and one row is returned per market:
+# period, load of each location, transmission limit, LMPs of the previous period, bid limit of each role
+def observation(period, loads, transLimit, lastLmp, maxGen):
+    return np.column_stack([period, loads, transLimit, lastLmp, maxGen]).astype(float)
+
+def checkClearing(clearing, network=network):
+    # raise when the clearing mode cannot run on this grid and installation
+    if clearing not in ['period', 'horizon']:
+        raise ValueError(f'Unknown clearing mode: {clearing}')
+    if clearing == 'horizon':
+        if not network.isTwoBus():
+            raise ValueError(f"The 'horizon' clearing needs the two-bus grid, the network has {network.busNum} buses.")
+        if commitment.gp is None:
+            raise ImportError("gurobipy is required for the 'horizon' clearing.")
+
+# state of one game (room), so that a single server process can host many independent games
+class GameSession:
+    def __init__(self, code, roles, backend='merit', seed=None, loadProfile=loadProfile, transLimit=transLimit, network=network, windProfile=windProfile, solarProfile=solarProfile, history=None, checkpoint=None, clearing='period', window=24):
+        self.code = code
+        # room codes are reused across sessions, the start time tells the games apart in the history
+        self.started = time.time()
+        self.roles = roles
+        self.backend = backend
+        # every game draws renewables and bot markups from its own generator, so seeded games are reproducible
+        self.rng = np.random.default_rng(seed)
+        self.loadProfile = loadProfile
+        self.windProfile = windProfile
+        self.solarProfile = solarProfile
+        self.transLimit = transLimit
+        # every round has one period per entry of the load profile
+        self.numPeriods = len(loadProfile[0])
+        self.network = network
+        # GameHistory that records every cleared period, None to keep the game in memory only
+        self.history = history
+        # Checkpointer that snapshots the game after every bid and clear, None to disable crash recovery
+        self.checkpoint = checkpoint
+        # bidding policies by role ID for the roles without a human player, each one maps the observation
+        # (markets x features) to bid prices (markets,); the other roles keep the cost-based bot
+        self.policies = {}
+        # gurobi dispatch model kept alive across periods and rounds, created on the first gurobi clear
+        self.dispatchModel = None
+        # 'period' clears every period on its own, 'horizon' co-optimizes a rolling window of periods with
+        # commitment and ramp limits (two-bus grid and gurobi only), the model is created on the first clear
+        checkClearing(clearing, network)
+        self.clearing = clearing
+        self.window = window
+        self.horizon = None
+        self.round = 1
+        self.roleID_gameID = {}
+        self.renewBidLimit = {}
+        # set and replaced on every clear or round change to wake up all player sessions of this game
+        self.changed = asyncio.Event()
+        self.startRound()
+
+    def startRound(self):
+        # reset the states and initialize the information for period 1
+        self.period = 1
+        self.periodBid_submitted = [False for i in range(0, 6)]
+        # players take other roles in the next round, they flag their new role again when they rejoin
+        self.roleByRealPlayer = [False for i in range(0, 6)]
+        # the book of a period is opened when the period starts, so long horizons do not hold empty books
+        self.bids_period = {1: BidBook()}
+        self.ledger = SettlementLedger(self.roles, renewCredit, periods=self.numPeriods, locNum=self.network.busNum)
+        if self.horizon is not None:
+            # the warm start does not carry over to a new round
+            self.horizon.lastCommit = None
+        self.drawRenewables()
+
+    def drawRenewables(self):
+        # set bid limit for renewable generators in the current period
+        # the bid limit can be regarded as actual generation that differs from forecast
+        for i in range(1, 7):
+            role = self.roles[str(i)]
+            if role['Fuel'] == 'wind':
+                self.renewBidLimit[str(i)] = int(role['Nameplate Capacity (Maximum possible generation MW)'] * self.windProfile[self.period - 1] * self.rng.normal(1, 0.1))
+            elif role['Fuel'] == 'solar':
+                self.renewBidLimit[str(i)] = int(role['Nameplate Capacity (Maximum possible generation MW)'] * self.solarProfile[self.period - 1] * self.rng.normal(1, 0.1))
+
+    def toState(self):
+        # everything needed to resume the game at the exact period, the gurobi model and the events are rebuilt
+        return {
+            'code': self.code,
+            'started': self.started,
+            'roles': self.roles,
+            'backend': self.backend,
+            'clearing': self.clearing,
+            'window': self.window,
+            # profiles are only stored when the game overrides the module ones, so a snapshot does not copy the
+            # whole horizon and memory-mapped profiles stay mapped after a restore
+            'loadProfile': None if self.loadProfile is loadProfile else self.loadProfile,
+            'windProfile': None if self.windProfile is windProfile else self.windProfile,
+            'solarProfile': None if self.solarProfile is solarProfile else self.solarProfile,
+            'transLimit': self.transLimit,
+            'round': self.round,
+            'period': self.period,
+            'roleID_gameID': dict(self.roleID_gameID),
+            'roleByRealPlayer': list(self.roleByRealPlayer),
+            'periodBid_submitted': list(self.periodBid_submitted),
+            'renewBidLimit': dict(self.renewBidLimit),
+            'bids_period': self.bids_period,
+            'ledger': self.ledger,
+            'rng': self.rng.bit_generator.state
+        }
+
+    @classmethod
+    def fromState(cls, state, history=None, checkpoint=None):
+        stored = lambda name, default: default if state.get(name) is None else state[name]
+        game = cls(state['code'], state['roles'], state['backend'], loadProfile=stored('loadProfile', loadProfile), transLimit=state['transLimit'],
+                   windProfile=stored('windProfile', windProfile), solarProfile=stored('solarProfile', solarProfile), history=history, checkpoint=checkpoint,
+                   clearing=state.get('clearing', 'period'), window=state.get('window', 24))
+        for name in ['started', 'round', 'period', 'roleID_gameID', 'roleByRealPlayer', 'periodBid_submitted', 'renewBidLimit', 'bids_period', 'ledger']:
+            setattr(game, name, state[name])
+        game.rng.bit_generator.state = state['rng']
+        return game
+
+    def save(self):
+        if self.checkpoint is not None:
+            self.checkpoint.save(self)
+
+    def observe(self):
+        period = self.period
+        loads = [self.loadProfile[l][period - 1] if l in self.loadProfile else 0 for l in range(self.network.busNum)]
+        lastLmp = self.ledger.clearingPrice[period - 2] if period > 1 else np.zeros(self.network.busNum)
+        maxGen = [self.renewBidLimit[str(i)] if self.roles[str(i)]['Fuel'] in ['wind', 'solar'] else self.roles[str(i)]['Capacity (MW)'] for i in range(1, 7)]
+        return observation([period], [loads], [self.transLimit[self.round]], [lastLmp], [maxGen])
+
+    def forecastBids(self, period):
+        # bids assumed for a lookahead period: every role repeats its current bids, renewables offer
+        # their forecast generation at their lowest current price
+        book = BidBook()
+        current = self.bids_period[self.period]
+        for i in range(1, 7):
+            role = self.roles[str(i)]
+            if role['Fuel'] in ['wind', 'solar']:
+                profile = self.windProfile if role['Fuel'] == 'wind' else self.solarProfile
+                prices = current.rolePrices(i)
+                book.add(role['Nameplate Capacity (Maximum possible generation MW)'] * profile[period - 1], prices.min() if len(prices) else -renewCredit + 10, role['Location'], i)
+            else:
+                for k in current.roleIdx.get(i, []):
+                    book.add(current.amountCol[k], current.priceCol[k], current.locCol[k], i)
+        return book
+
+    def clearHorizon(self, period, loads):
+        if self.horizon is None:
+            self.horizon = RollingHorizon(self.roles, self.window)
+        last = min(period + self.window - 1, self.numPeriods)
+        books = [self.bids_period[period]] + [self.forecastBids(t) for t in range(period + 1, last + 1)]
+        # loads of the cleared period, then the load profile for the lookahead periods
+        windowLoads = [loads] + [[self.loadProfile[l][t - 1] if l in self.loadProfile else 0 for l in range(self.network.busNum)] for t in range(period + 1, last + 1)]
+        prevGen = self.ledger.dispatch[:, period - 2] if period > 1 else None
+        return self.horizon.solve(books, windowLoads, self.transLimit[self.round], prevGen)
+
+    def notify(self):
+        renderCache.invalidate(self.code)
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def waitChange(self):
+        await self.changed.wait()
+
+    def joinPlayer(self, gameID):
+        # map the role ID to game ID and return the role played in the current round
+        roleID = gameID_role[gameID][f'round {self.round}']
+        if self.roleID_gameID.get(roleID) != gameID:
+            # the player tables show who plays each role
+            renderCache.invalidate(self.code)
+        self.roleID_gameID[roleID] = gameID
+        self.roleByRealPlayer[roleID - 1] = True
+        self.save()
+        return roleID
+
+    # segments is the bid curve of the role as a list of (amount, price), empty segments are dropped
+    # round and period are those the bid was made for, the bid is rejected when the market moved on in between
+    @metrics.timed()
+    def submitBid(self, roleID, segments, period=None, round=None):
+        if (period is not None and period != self.period) or (round is not None and round != self.round):
+            return False
+        if self.period <= self.numPeriods and not self.bids_period[self.period].hasRole(roleID):
+            for amount, price in segments:
+                if amount > 0:
+                    self.bids_period[self.period].add(amount, price, self.roles[str(roleID)]['Location'], roleID)
+        self.periodBid_submitted[roleID - 1] = True
+        self.save()
+        return True
+
+    # clear the market by solving the dispatch problem and advance to the next period
+    @metrics.timed()
+    def clearMarket(self):
+        period = self.period
+        roles = self.roles
+        for i in range(1, 7):
+            # for roles not taken by real players, submit bids based on cost
+            if not self.periodBid_submitted[i - 1]:
+                role = roles[str(i)]
+                if i in self.policies and not self.roleByRealPlayer[i - 1]:
+                    bidGen = self.renewBidLimit[str(i)] if role['Fuel'] in ['wind', 'solar'] else role['Capacity (MW)']
+                    bidPrice = float(np.asarray(self.policies[i](self.observe())).ravel()[0])
+                elif role['Fuel'] in ['wind', 'solar']:
+                    bidGen = self.renewBidLimit[str(i)]
+                    bidPrice = -renewCredit + 10
+                else:
+                    bidGen = role['Capacity (MW)']
+                    bidPrice = role['Generation Cost ($/MWh)'] + int(self.rng.integers(0, int(0.2 * role['Generation Cost ($/MWh)']), endpoint=True))
+                self.bids_period[period].add(bidGen, bidPrice, role['Location'], i)
+        if self.backend == 'gurobi' and self.dispatchModel is None:
+            self.dispatchModel = DispatchModel()
+        loads = [self.loadProfile[l][period - 1] if l in self.loadProfile else 0 for l in range(self.network.busNum)]
+        if self.clearing == 'horizon':
+            genSol, lmp = self.clearHorizon(period, loads)
+        elif self.network.isTwoBus():
+            genSol, lmp = dispatchCache.dispatch(self.bids_period[period], loads, self.transLimit[self.round], backend=self.backend, model=self.dispatchModel)
+        else:
+            genSol, lmp = networkDispatch(self.bids_period[period], loads, self.network, backend='gurobi' if self.backend == 'gurobi' else 'highs')
+        # calculate accumulated revenue and profit for each generator
+        self.ledger.settle(genSol, lmp)
+        if self.history is not None:
+            self.history.record(self, period)
+        self.period += 1
+        if self.period <= self.numPeriods:
+            self.bids_period[self.period] = BidBook()
+            self.drawRenewables()
+            self.periodBid_submitted = [False for i in range(0, 6)]
+        self.save()
+        self.notify()
+
+    def nextRound(self):
+        if self.round == 1:
+            self.roleID_gameID = {}
+            self.round = 2
+            self.startRound()
+            self.save()
+            self.notify()
+
+# all games hosted by this process, keyed by room code
+games = {}
+gamesLock = threading.Lock()
+
+def getGame(code, roles, backend='merit', history=None, checkpoint=None, clearing='period'):
+    with gamesLock:
+        if code not in games:
+            games[code] = GameSession(code, roles, backend, history=history, checkpoint=checkpoint, clearing=clearing)
+        return games[code]
+
+def restoreGames(checkpoint, history=None):
+    # resume every checkpointed game, players re-attach by entering the same room code and game ID
+    with gamesLock:
+        for code, state in checkpoint.load().items():
+            games[code] = GameSession.fromState(state, history=history, checkpoint=checkpoint)
+    return len(games)
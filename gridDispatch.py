@@ -1,27 +1,225 @@
-import gurobipy as gp
-from gurobipy import GRB
-
-def gridDispatch(bids, loads, transLimit):
-    maxGen = [bid.amount for bid in bids]
-    cost = [bid.price for bid in bids]
-    loc = [bid.loc for bid in bids]
-    env = gp.Env(empty=True)
-    env.setParam("OutputFlag",0)
-    env.start()
-    m = gp.Model('dispatch', env=env)
-    genNum = len(bids)
-    gen = m.addVars(genNum, lb=0, ub=maxGen, name='gen')
-    #genCons1 = m.addConstrs((gen[i] >= 0 for i in range(genNum)), name='genCons1')
-    #genCons2 = m.addConstrs((gen[i] <= maxGen[i] for i in range(genNum)), name='genCons2')
-    trans_01 = m.addVar(lb=-transLimit, ub=transLimit, name='trans_01')
-    balance_loc0 = m.addConstr(gp.quicksum([gen[i] for i in range(genNum) if loc[i] == 0]) - trans_01 == loads[0], name='balance_loc0')
-    balance_loc1 = m.addConstr(gp.quicksum([gen[i] for i in range(genNum) if loc[i] == 1]) + trans_01 == loads[1], name='balance_loc1')
-
-    m.setObjective(gp.quicksum([gen[i] * cost[i] for i in range(genNum)]), GRB.MINIMIZE)
-    m.optimize()
-
-    if m.SolCount > 1:
-        m.setParam(GRB.Param.SolutionNumber, 0)
-    genSol = [(bids[i].id, gen[i].x) for i in range(genNum)]
-    lmp = [balance_loc0.Pi, balance_loc1.Pi]
+from collections import OrderedDict
+import numpy as np
+from bidBook import asBidBook
+from metrics import metrics
+
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:
+    # the merit-order backend does not need Gurobi, so the game can run without a license
+    gp = None
+
+# numerical tolerance used when comparing accumulated bids against loads and line limits
+tol = 1e-6
+
+def clearNode(price, amount, load, order):
+    # fill the load along the merit order (indices into price/amount), the bid carrying the last MW sets the marginal price
+    gen = np.zeros(len(price))
+    if len(order) == 0:
+        if load > tol:
+            raise ValueError('Bids are not enough to meet the load.')
+        return gen, 0.0
+    accumAmount = np.cumsum(amount[order])
+    k = int(np.searchsorted(accumAmount, load - tol, side='left'))
+    if k >= len(order):
+        raise ValueError('Bids are not enough to meet the load.')
+    gen[order[:k]] = amount[order[:k]]
+    gen[order[k]] = max(load - (accumAmount[k - 1] if k > 0 else 0), 0)
+    return gen, float(price[order[k]])
+
+def meritDispatch(bids, loads, transLimit):
+    bids = asBidBook(bids)
+    maxGen = bids.amount
+    cost = bids.price
+    loc = bids.loc
+    order = bids.sortedIdx()
+    # clear the two locations as one copper plate first, trans_01 only matters if that flow violates its limit
+    gen, price = clearNode(cost, maxGen, loads[0] + loads[1], order)
+    trans_01 = gen[loc == 0].sum() - loads[0]
+    if abs(trans_01) <= transLimit + tol:
+        lmp = [price, price]
+    else:
+        # congested: the line runs at its limit and each location clears its own net load
+        trans_01 = np.sign(trans_01) * transLimit
+        gen = np.zeros(len(bids))
+        lmp = []
+        for l, netLoad in ((0, loads[0] + trans_01), (1, loads[1] - trans_01)):
+            genLoc, price = clearNode(cost, maxGen, netLoad, bids.locationIdx(l))
+            gen += genLoc
+            lmp.append(price)
+    genSol = [(int(bids.role[i]), float(gen[i])) for i in range(len(bids))]
     return genSol, lmp
+
+def clearNodeBatch(price, amount, load, mask):
+    # clearNode for a batch of independent markets: one market per row, bids outside mask do not take part
+    # rows that cannot meet their load get a nan price
+    price = np.where(mask, price, np.inf)
+    amount = np.where(mask, amount, 0)
+    order = np.argsort(price, axis=1, kind='stable')
+    sortedPrice = np.take_along_axis(price, order, axis=1)
+    sortedAmount = np.take_along_axis(amount, order, axis=1)
+    accumAmount = np.cumsum(sortedAmount, axis=1)
+    rows = np.arange(len(price))
+    k = (accumAmount < load[:, None] - tol).sum(axis=1)
+    kc = np.minimum(k, price.shape[1] - 1)
+    prevAmount = np.where(k > 0, accumAmount[rows, np.maximum(k - 1, 0)], 0)
+    col = np.arange(price.shape[1])[None, :]
+    sortedGen = np.where(col < k[:, None], sortedAmount, 0)
+    sortedGen[rows, kc] += np.where(k < price.shape[1], np.maximum(load - prevAmount, 0), 0)
+    gen = np.zeros(price.shape)
+    np.put_along_axis(gen, order, sortedGen, axis=1)
+    lmp = sortedPrice[rows, kc]
+    # a location without bids and without load has nothing to price
+    lmp = np.where(np.isinf(lmp) & (load <= tol), 0, lmp)
+    lmp = np.where((k >= price.shape[1]) | np.isinf(lmp), np.nan, lmp)
+    return gen, lmp
+
+def batchDispatch(maxGen, cost, loc, loads, transLimit):
+    # meritDispatch for B markets at once: maxGen and cost are (B x bids), loc is (bids,) or (B x bids),
+    # loads is (B x 2) and transLimit a scalar or (B,); returns gen (B x bids) and lmp (B x 2)
+    maxGen = np.asarray(maxGen, dtype=float)
+    cost = np.asarray(cost, dtype=float)
+    loc = np.broadcast_to(loc, maxGen.shape)
+    loads = np.asarray(loads, dtype=float)
+    transLimit = np.broadcast_to(np.asarray(transLimit, dtype=float), (len(maxGen),))
+    gen, price = clearNodeBatch(cost, maxGen, loads.sum(axis=1), np.ones(maxGen.shape, dtype=bool))
+    lmp = np.stack([price, price], axis=1)
+    trans_01 = (gen * (loc == 0)).sum(axis=1) - loads[:, 0]
+    congested = np.abs(trans_01) > transLimit + tol
+    if congested.any():
+        trans_01 = np.sign(trans_01[congested]) * transLimit[congested]
+        c = congested
+        gen0, lmp0 = clearNodeBatch(cost[c], maxGen[c], loads[c, 0] + trans_01, loc[c] == 0)
+        gen1, lmp1 = clearNodeBatch(cost[c], maxGen[c], loads[c, 1] - trans_01, loc[c] == 1)
+        gen[c] = gen0 + gen1
+        lmp[c] = np.stack([lmp0, lmp1], axis=1)
+    return gen, lmp
+
+env = None
+
+def getEnv():
+    # start the gurobi environment once per process, the license check is the slow part
+    global env
+    if gp is None:
+        raise ImportError('gurobipy is required for the gurobi dispatch backend.')
+    if env is None:
+        env = gp.Env(empty=True)
+        env.setParam("OutputFlag",0)
+        env.start()
+    return env
+
+class DispatchModel:
+    # long-lived dispatch LP, only the data that changed since the last clear is pushed to gurobi
+    # so that each re-solve starts from the previous basis
+    def __init__(self):
+        self.m = gp.Model('dispatch', env=getEnv())
+        self.gen = []
+        self.maxGen = []
+        self.cost = []
+        self.loc = []
+        self.loads = [0, 0]
+        self.transLimit = 0
+        self.trans_01 = self.m.addVar(lb=0, ub=0, name='trans_01')
+        self.balance_loc0 = self.m.addConstr(-self.trans_01 == 0, name='balance_loc0')
+        self.balance_loc1 = self.m.addConstr(self.trans_01 == 0, name='balance_loc1')
+        self.m.ModelSense = GRB.MINIMIZE
+
+    def balance(self, loc):
+        return self.balance_loc0 if loc == 0 else self.balance_loc1
+
+    def update(self, bids, loads, transLimit):
+        bids = asBidBook(bids)
+        # add generation variables when there are more bids than ever before, unused ones are capped at 0
+        while len(self.gen) < len(bids):
+            i = len(self.gen)
+            self.gen.append(self.m.addVar(lb=0, ub=0, obj=0, name=f'gen[{i}]', column=gp.Column([1], [self.balance_loc0])))
+            self.maxGen.append(0)
+            self.cost.append(0)
+            self.loc.append(0)
+        maxGen = bids.amount.tolist() + [0] * (len(self.gen) - len(bids))
+        cost = bids.price.tolist() + [0] * (len(self.gen) - len(bids))
+        loc = bids.loc.tolist()
+        for i in range(len(bids)):
+            if loc[i] != self.loc[i]:
+                self.m.chgCoeff(self.balance(self.loc[i]), self.gen[i], 0)
+                self.m.chgCoeff(self.balance(loc[i]), self.gen[i], 1)
+                self.loc[i] = loc[i]
+        changed = [i for i in range(len(self.gen)) if maxGen[i] != self.maxGen[i]]
+        if changed:
+            self.m.setAttr('UB', [self.gen[i] for i in changed], [maxGen[i] for i in changed])
+        changed = [i for i in range(len(self.gen)) if cost[i] != self.cost[i]]
+        if changed:
+            self.m.setAttr('Obj', [self.gen[i] for i in changed], [cost[i] for i in changed])
+        self.maxGen = maxGen
+        self.cost = cost
+        if list(loads) != self.loads:
+            self.balance_loc0.RHS = loads[0]
+            self.balance_loc1.RHS = loads[1]
+            self.loads = list(loads)
+        if transLimit != self.transLimit:
+            self.trans_01.LB = -transLimit
+            self.trans_01.UB = transLimit
+            self.transLimit = transLimit
+
+    def solve(self, bids, loads, transLimit):
+        bids = asBidBook(bids)
+        self.update(bids, loads, transLimit)
+        self.m.optimize()
+        if self.m.Status != GRB.OPTIMAL:
+            raise ValueError('Bids are not enough to meet the load.')
+        genSol = [(int(bids.role[i]), self.gen[i].X) for i in range(len(bids))]
+        lmp = [self.balance_loc0.Pi, self.balance_loc1.Pi]
+        return genSol, lmp
+
+# backend='merit' sorts the bids natively, backend='gurobi' solves the LP and is kept as a reference
+# pass a DispatchModel to re-solve the same gurobi model instead of building a new one
+@metrics.timed()
+def gridDispatch(bids, loads, transLimit, backend='merit', model=None):
+    if backend == 'merit':
+        return meritDispatch(bids, loads, transLimit)
+    elif backend == 'gurobi':
+        if model is None:
+            model = DispatchModel()
+        return model.solve(bids, loads, transLimit)
+    raise ValueError(f'Unknown dispatch backend: {backend}')
+
+# LRU cache in front of gridDispatch, keyed by a canonical fingerprint of the bids (sorted (amount, price, loc)
+# rows), the loads and the line limit; results are stored in canonical order and mapped back to the caller's rows
+class DispatchCache:
+    def __init__(self, maxSize=4096):
+        self.maxSize = maxSize
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def fingerprint(self, bids, loads, transLimit, backend):
+        order = np.lexsort((bids.loc, bids.price, bids.amount))
+        rows = np.column_stack([bids.amount[order], bids.price[order], bids.loc[order]])
+        key = (backend, rows.tobytes(), np.asarray(loads, dtype=float).tobytes(), float(transLimit))
+        return key, order
+
+    def dispatch(self, bids, loads, transLimit, backend='merit', model=None):
+        bids = asBidBook(bids)
+        key, order = self.fingerprint(bids, loads, transLimit, backend)
+        if key in self.results:
+            self.hits += 1
+            self.results.move_to_end(key)
+            genSorted, lmp = self.results[key]
+        else:
+            self.misses += 1
+            genSol, lmp = gridDispatch(bids, loads, transLimit, backend=backend, model=model)
+            genSorted = np.array([gen[1] for gen in genSol])[order]
+            self.results[key] = (genSorted, lmp)
+            if len(self.results) > self.maxSize:
+                self.results.popitem(last=False)
+        gen = np.empty(len(bids))
+        gen[order] = genSorted
+        genSol = [(int(bids.role[i]), float(gen[i])) for i in range(len(bids))]
+        return genSol, list(lmp)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.results), 'hitRate': self.hits / total if total else 0}
+
+dispatchCache = DispatchCache()
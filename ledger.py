@@ -0,0 +1,63 @@
+import numpy as np
+
+# settlement of one round stored as (roles x periods) arrays, every clear settles one column in a single step
+# accumulated dispatch, revenue and profit are kept as prefix sums so reads do not depend on the game length
+class SettlementLedger:
+    def __init__(self, roles, renewCredit, periods=4, locNum=2):
+        roleIDs = sorted(int(i) for i in roles.keys())
+        self.roleNum = len(roleIDs)
+        role = [roles[str(i)] for i in roleIDs]
+        self.loc = np.array([r['Location'] for r in role])
+        self.cost = np.array([r['Generation Cost ($/MWh)'] for r in role], dtype=float)
+        renewable = np.array([r['Fuel'] in ['wind', 'solar'] for r in role])
+        self.creditRate = renewCredit * renewable
+        # only coal units are penalized when not being dispatched
+        self.penaltyRate = np.array([r.get('Not-dispatched Penalty (per period)', 0) if r['Fuel'] == 'coal' else 0 for r in role], dtype=float)
+        self.periods = 0
+        self.columns = ['dispatch', 'lmp', 'revenue', 'profit', 'penalty', 'taxCredit', 'accumDispatch', 'accumRevenue', 'accumProfit']
+        for name in self.columns:
+            setattr(self, name, np.zeros((self.roleNum, periods)))
+        self.clearingPrice = np.zeros((periods, locNum))
+
+    def grow(self):
+        for name in self.columns:
+            col = getattr(self, name)
+            setattr(self, name, np.concatenate([col, np.zeros_like(col)], axis=1))
+        self.clearingPrice = np.concatenate([self.clearingPrice, np.zeros_like(self.clearingPrice)])
+
+    def settlement(self, dispatch, lmp):
+        # dispatch is (..., roles) and lmp (..., locations), any leading batch shape is settled at once
+        lmpRole = np.asarray(lmp, dtype=float)[..., self.loc]
+        taxCredit = self.creditRate * dispatch
+        penalty = self.penaltyRate * (dispatch == 0)
+        revenue = lmpRole * dispatch + taxCredit
+        profit = revenue - self.cost * dispatch - penalty
+        return lmpRole, revenue, profit, penalty, taxCredit
+
+    def settle(self, genSol, lmp):
+        t = self.periods
+        if t == self.dispatch.shape[1]:
+            self.grow()
+        roleID = np.array([gen[0] for gen in genSol], dtype=int)
+        gen = np.array([gen[1] for gen in genSol], dtype=float)
+        # a role may hold several bid rows, its dispatch is the sum of them
+        dispatch = np.bincount(roleID - 1, weights=gen, minlength=self.roleNum)
+        self.dispatch[:, t] = dispatch
+        self.lmp[:, t], self.revenue[:, t], self.profit[:, t], self.penalty[:, t], self.taxCredit[:, t] = self.settlement(dispatch, lmp)
+        self.clearingPrice[t] = lmp
+        for name, value in [('accumDispatch', self.dispatch), ('accumRevenue', self.revenue), ('accumProfit', self.profit)]:
+            accum = getattr(self, name)
+            accum[:, t] = value[:, t] + (accum[:, t - 1] if t > 0 else 0)
+        self.periods += 1
+
+    # the readers below take the role ID and the 1-based period, like the rest of the game
+    def accumRevenueOf(self, roleID, period):
+        return self.accumRevenue[roleID - 1, period - 1] if period >= 1 else 0
+
+    def accumProfitOf(self, roleID, period):
+        return self.accumProfit[roleID - 1, period - 1] if period >= 1 else 0
+
+    def avgProfit(self, roleID, period):
+        if period < 1 or self.accumDispatch[roleID - 1, period - 1] == 0:
+            return 0
+        return int(self.accumProfit[roleID - 1, period - 1] / self.accumDispatch[roleID - 1, period - 1])
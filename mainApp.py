@@ -1,45 +1,21 @@
-from pywebio import start_server
+from pywebio.platform.tornado import webio_handler, STATIC_PATH
 from pywebio.input import *
 from pywebio.output import *
-from pywebio.session import run_async
+from pywebio.session import defer_call
 from functools import partial
-import time
-import asyncio
 import json
-import plotly
-import plotly.express as px
-from gridDispatch import gridDispatch
-import pandas as pd
-import numpy as np
+import charts
+from renderCache import renderCache
+from parametric import lmpVsLoad, lmpVsLimit
+from gameHistory import GameHistory
+from checkpoint import Checkpointer
+from gameSession import getGame, restoreGames, checkClearing, locIdx_name
 import sys
-import random
-import os
-import pickle
-
-gameID_role = {
-    1: {
-        'round 1': 1,
-        'round 2': 2
-    },
-    2: {
-        'round 1': 2,
-        'round 2': 4
-    },
-    3: {
-        'round 1': 3,
-        'round 2': 1
-    },
-    4: {
-        'round 1': 4,
-        'round 2': 3
-    },
-    5: {
-        'round 1': 5,
-        'round 2': 6
-    },
-
-}
-roleID_gameID = {}
+import tornado.ioloop
+import tornado.web
+from metrics import metrics
+from gameSession import games
+from gridDispatch import dispatchCache
 
 roleDescription = [
     'Plants that are running continuously over time and used to cater the base demand of the grid are said to be base-load power plants. Examples include nuclear, coal-fired, and combined cycles.\nYour power plant has large generation capacity and low marginal cost. But because of some physical and mechanical constraints (e.g. start or change output slowly), you will be penalized when not being dispatched (dispatch result=0).\n\nObjective: Maximize profit = market revenue - generation cost - penalty of not being dispatched\nOther Attributes:',
@@ -48,292 +24,201 @@ roleDescription = [
     'As the gamemaster, you cover load-serving entities (e.g. ComEd) and grid operator. The "Clear Market" button will trigger a dispatch solver that selects the least-cost combination of generator bids to meet the load in two places and advance the game to next period.'
 ]
 
-roleByRealPlayer = [False for i in range(0, 6)]
-
-round = 1
-period = 1
-
-# renewable generation and load profiles
-windProfile = [0.7, 0.3, 0.3, 0.6]
-solarProfile = [0, 0.9, 0.8, 0]
-locIdx_name = {0: 'South', 1: 'North'}
-loadProfile = {
-    0: [400, 600, 760, 550],
-    1: [50, 60, 70, 40]
-}
-transLimit = {1: 200, 2: 5000}
-
-periodBid_submitted = [False for i in range(0, 6)]
-class bid:
-    def __init__(self, amount, price, location, roleID):
-        self.amount = amount
-        self.price = price
-        self.loc = location
-        self.id = roleID
-    def __lt__(self, other):
-        return self.price < other.price
+# read once and shared by every session
+roles = json.load(open('./generators.json'))
+mapImage = open('./map.png', 'rb').read()
 
-bids_period = {
-    1: [],
-    2: [],
-    3: [],
-    4: []
-}
-renewBidLimit = {}
+# 'merit' clears the bids natively, 'gurobi' solves the same dispatch LP for cross-checking
+dispatchBackend = 'merit'
+# 'period' clears each period on its own, 'horizon' co-optimizes a rolling window of periods with commitment and ramping
+clearingMode = 'period'
+test = True
+# every cleared period is recorded here when not testing
+history = None
+# live games are snapshotted here after every bid and clear, and resumed when the server restarts
+checkpoint = None
+# trained bidding policies (see marketEnv.py) by role ID, they bid for the roles that no player has taken
+botPolicies = {}
+# number of price-quantity segments a player can bid for one generator
+bidSegments = 5
 
-clearingPrice = []
-dispatchRes = {}
-revenue = {}
-profit = {}
-# renewable tax credit
-renewCredit = 30
+@metrics.timed()
+def renderForecast(game):
+    period = game.period
+    windTotal = 0
+    solarTotal = 0
+    for role in game.roles.values():
+        if role['Fuel'] == 'wind':
+            windTotal += role['Nameplate Capacity (Maximum possible generation MW)']
+        elif role['Fuel'] == 'solar':
+            solarTotal += role['Nameplate Capacity (Maximum possible generation MW)']
+    periodArray = list(range(1, game.numPeriods + 1))
+    html1 = charts.bar(periodArray, [('Wind', [windTotal * w for w in game.windProfile], charts.colors[0]), ('Solar', [solarTotal * s for s in game.solarProfile], 'orange')],
+                       'Period', 'Generation (MW)', [0, 1000], highlight=period)
+    loadColors = [charts.colors[4], charts.colors[3]]
+    html2 = charts.bar(periodArray, [(locIdx_name[l], game.loadProfile[l], loadColors[l % 2]) for l in game.loadProfile],
+                       'Period', 'Load (MW)', [0, 1000], highlight=period)
+    return html1, html2
 
-def showMarketInfo(roles):
-    global period
+@metrics.timed()
+def showMarketInfo(game):
+    roles = game.roles
     with use_scope('market', clear=True):
         put_text('Generator Information:')
         tableHeader = ['Role ID', 'Fuel Type', 'Location', 'Player ID', 'Nameplate Capacity (MW)']
         tableContent = []
-        windTotal = 0
-        solarTotal = 0
         for i in range(1, 7):
-            if i in roleID_gameID.keys():
-                gameID = str(roleID_gameID[i])
+            if i in game.roleID_gameID.keys():
+                gameID = str(game.roleID_gameID[i])
             else:
                 gameID = 'None'
             roleID = i
             role = roles[str(roleID)]
             if role['Fuel'] in ['wind', 'solar']:
                 capacity = role['Nameplate Capacity (Maximum possible generation MW)']
-                if role['Fuel'] == 'wind':
-                    windTotal += capacity
-                else:
-                    solarTotal += capacity
             else:
                 capacity = role['Capacity (MW)']
             row = [str(roleID), role['Fuel'], locIdx_name[role['Location']], gameID, str(capacity)]
             tableContent.append(row)
         put_table(tableContent, header=tableHeader)
+        html1, html2 = renderCache.get((game.code, game.round, game.period, 'info'), partial(renderForecast, game))
         put_text('Renewable Generation Forecast:')
-        renewDf = pd.DataFrame()
-        periodArray = [1, 2, 3, 4]
-        renewDf['Period'] = periodArray
-        renewDf['Wind'] = [windTotal * w for w in windProfile]
-        renewDf['Solar'] = [solarTotal * s for s in solarProfile]
-        fig1 = px.bar(renewDf, x='Period', y=['Wind', 'Solar'])
-        fig1.update_yaxes(range=[0, 1000])
-        fig1.update_layout(yaxis_title='Generation (MW)')
-        fig1["data"][0]["marker"]["opacity"] = [1 if c == period else 0.5 for c in fig1["data"][0]["x"]]
-        fig1["data"][1]["marker"]["opacity"] = [1 if c == period else 0.5 for c in fig1["data"][1]["x"]]
-        fig1["data"][0]["marker"]["color"] = [plotly.colors.DEFAULT_PLOTLY_COLORS[0] for c in fig1["data"][0]["x"]]
-        fig1["data"][1]["marker"]["color"] = ['orange' for c in fig1["data"][1]["x"]]
-        html = fig1.to_html(include_plotlyjs="require", full_html=False)
-        put_html(html)
-
+        put_html(html1)
         put_text('Load Forecast:')
-        loadDf = pd.DataFrame()
-        loadDf['Period'] = periodArray
-        loadDf['South'] = loadProfile[0]
-        loadDf['North'] = loadProfile[1]
-        fig2 = px.bar(loadDf, x='Period', y=['South', 'North'])
-        fig2.update_yaxes(range=[0, 1000])
-        fig2.update_layout(yaxis_title='Load (MW)')
-        fig2["data"][0]["marker"]["opacity"] = [1 if c == period else 0.5 for c in fig2["data"][0]["x"]]
-        fig2["data"][1]["marker"]["opacity"] = [1 if c == period else 0.5 for c in fig2["data"][1]["x"]]
-        fig2["data"][0]["marker"]["color"] = [plotly.colors.DEFAULT_PLOTLY_COLORS[4] for c in fig1["data"][0]["x"]]
-        fig2["data"][1]["marker"]["color"] = [plotly.colors.DEFAULT_PLOTLY_COLORS[3] for c in fig1["data"][1]["x"]]
-        html = fig2.to_html(include_plotlyjs="require", full_html=False)
-        put_html(html)
+        put_html(html2)
 
 
-def showBids(period):
-    put_text(f'Round {round}, Period {period}')
-    if len(bids_period[period]) > 0:
-        prices = [bid.price for bid in bids_period[period]]
-        amounts = [bid.amount for bid in bids_period[period]]
-        bidDf = pd.DataFrame()
-        bidDf['amount'] = amounts
-        bidDf['price'] = prices
-        bidDf.sort_values(by='price', inplace=True)
-        bidDf['accumAmount'] = bidDf['amount'].cumsum()
-        #print(bidDf)
-        fig = px.line(bidDf, x='accumAmount', y='price', line_shape='vh')
-        #fig = px.histogram(x=prices, y=amounts, histfunc='sum', nbins=50)
-        #fig = px.ecdf(x=amounts, y=prices, ecdfnorm=None, orientation='h')
-        lmp_loc0 = clearingPrice[period - 1][0]
-        lmp_loc1 = clearingPrice[period - 1][1]
-        fig.add_hline(y=lmp_loc0, line_dash='dash', line_color='firebrick', annotation_text='LMP_South', annotation_position='top left')
-        fig.add_hline(y=lmp_loc1, line_dash='dash', line_color='firebrick', annotation_text='LMP_North', annotation_position='top right')
-        totalLoad = loadProfile[0][period - 1] + loadProfile[1][period - 1]
-        fig.add_vline(x=totalLoad, line_dash='dash', line_color='orange', annotation_text='Total Load')
-        fig.update_layout(yaxis_title='Price ($/MW)')
-        fig.update_layout(xaxis_title='Accumulated Bid Generation (MW)')
-        fig.update_annotations(font_size=16)
-        html = fig.to_html(include_plotlyjs="require", full_html=False)
-        put_html(html)
+@metrics.timed()
+def renderBids(game, period):
+    clearingPrice = game.ledger.clearingPrice
+    prices, accumAmount = game.bids_period[period].supplyCurve()
+    hlines = [(clearingPrice[period - 1][l], f'LMP_{name}', 'firebrick', 'left' if l % 2 == 0 else 'right') for l, name in locIdx_name.items()]
+    totalLoad = sum(game.loadProfile[l][period - 1] for l in game.loadProfile)
+    return charts.line([('Bids', accumAmount, prices)], 'Accumulated Bid Generation (MW)', 'Price ($/MW)', shape='vh',
+                       hlines=hlines, vlines=[(totalLoad, 'Total Load', 'orange', 'left')], fontSize=16)
 
-def showDispatch(period, roles):
-    put_text(f'Locational Marginal Price (Market Clearing Price, $/MWh):\n South: {clearingPrice[period - 1][0]}, North: {clearingPrice[period - 1][1]}')
-    tableHeader = ['Role', 'Fuel', 'Location', 'Player', 'Bid Capacity (MW)', 'Bid Price ($/MW)', 'Dispatch Result (MW)', 'Accum. Revenue ($)', 'Accum. Profit ($)', 'Average Profit ($/MW)']
+@metrics.timed()
+def showBids(game, period):
+    put_text(f'Round {game.round}, Period {period}')
+    if len(game.bids_period[period]) > 0:
+        put_html(renderCache.get((game.code, game.round, period, 'bids'), partial(renderBids, game, period)))
+
+@metrics.timed()
+def dispatchTable(game, period):
+    roles = game.roles
+    ledger = game.ledger
     tableContent = []
     for i in range(1, 7):
-        if i in roleID_gameID.keys():
-            gameID = str(roleID_gameID[i])
+        if i in game.roleID_gameID.keys():
+            gameID = str(game.roleID_gameID[i])
         else:
             gameID = 'None'
         roleID = i
         role = roles[str(roleID)]
-        row = [str(roleID), role['Fuel'], locIdx_name[role['Location']], gameID, str(sum([bid.amount for bid in bids_period[period] if bid.id == roleID])), str(sum([bid.price for bid in bids_period[period] if bid.id == roleID])), str(dispatchRes[i][period - 1]), str(revenue[i][period - 1]), str(profit[i][period - 1])]
-        if sum(dispatchRes[i][:period]) == 0:
-            row.append('0')
-        else:
-            row.append(str(int(profit[i][period - 1] / sum(dispatchRes[i][:period]))))
+        bids = game.bids_period[period]
+        row = [str(roleID), role['Fuel'], locIdx_name[role['Location']], gameID, str(bids.roleAmount(roleID)), ', '.join(str(price) for price in bids.rolePrices(roleID)), str(ledger.dispatch[i - 1, period - 1]), str(ledger.accumRevenueOf(i, period)), str(ledger.accumProfitOf(i, period)), str(ledger.avgProfit(i, period))]
         tableContent.append(row)
+    return tableContent
+
+@metrics.timed()
+def showDispatch(game, period):
+    clearingPrice = game.ledger.clearingPrice
+    put_text('Locational Marginal Price (Market Clearing Price, $/MWh):\n ' + ', '.join(f'{name}: {clearingPrice[period - 1][l]}' for l, name in locIdx_name.items()))
+    tableHeader = ['Role', 'Fuel', 'Location', 'Player', 'Bid Capacity (MW)', 'Bid Price ($/MW)', 'Dispatch Result (MW)', 'Accum. Revenue ($)', 'Accum. Profit ($)', 'Average Profit ($/MW)']
+    tableContent = renderCache.get((game.code, game.round, period, 'dispatch'), partial(dispatchTable, game, period))
     put_table(tableContent, header=tableHeader)
-    if not test:
-        if not os.path.exists(f'./gameHistory/{portID}_{round}_{period}.pkl'):
-            with open(f'./gameHistory/{portID}_{round}_{period}.pkl', 'wb') as f:
-                pickle.dump(tableContent, f)
 
-def showMarketRes(roles):
+@metrics.timed()
+def showMarketRes(game):
     with use_scope('market', clear=True):
-        for p in range(1, period):
-            showBids(p)
-            showDispatch(p, roles)
+        for p in range(1, game.period):
+            showBids(game, p)
+            showDispatch(game, p)
+
+@metrics.timed()
+def renderSensitivity(game):
+    # LMPs of the last cleared period as functions of each location's load and of the transmission limit
+    period = game.period - 1
+    bids = game.bids_period[period]
+    loads = [game.loadProfile[0][period - 1], game.loadProfile[1][period - 1]]
+    limit = game.transLimit[game.round]
+    sweeps = []
+    for l in [0, 1]:
+        x, lmp = lmpVsLoad(bids, loads, limit, l, 0.5 * loads[l], 1.5 * loads[l])
+        sweeps.append((x, lmp, loads[l], f'{locIdx_name[l]} Load (MW)'))
+    x, lmp = lmpVsLimit(bids, loads, 0, min(2 * limit, sum(loads)))
+    sweeps.append((x, lmp, limit, 'Transmission Limit (MW)'))
+    htmls = []
+    for x, lmp, actual, title in sweeps:
+        series = [(f'LMP_{locIdx_name[l]}', x, lmp[:, l]) for l in [0, 1]]
+        htmls.append(charts.line(series, title, 'Price ($/MW)', shape='hv', vlines=[(actual, f'Period {period}', 'orange', 'left')]))
+    return htmls
+
+@metrics.timed()
+def showSensitivity(game):
+    if game.period == 1:
+        toast('Please clear the market first.')
+    elif not game.network.isTwoBus():
+        toast('Price sensitivity is only available for the two-bus grid.')
+    else:
+        with use_scope('market', clear=True):
+            put_text(f'Round {game.round}, Period {game.period - 1}: LMP sensitivity to load and transmission limit')
+            for html in renderCache.get((game.code, game.round, game.period, 'sensitivity'), partial(renderSensitivity, game)):
+                put_html(html)
+
+def check_bid(data, capacity):
+    amounts = [data[f'gen{k}'] or 0 for k in range(1, bidSegments + 1)]
+    if min(amounts) < 0:
+        return ('gen1', 'Generation bids cannot be negative!')
+    if sum(amounts) > capacity:
+        return ('gen1', 'Sum of generation bids cannot be higher than limit.')
 
-def showBidForm(role, roleID):
-    global periodBid_submitted
+async def showBidForm(game, role, roleID):
     clear('market')
     with use_scope('bid', clear=True):
-        if periodBid_submitted[roleID - 1] or period > 4:
+        if game.periodBid_submitted[roleID - 1] or game.period > game.numPeriods:
             put_text("You have submitted the bid for current period, please wait for the market clearing results.")
         else:
-            '''
-            def check_bid(data, capacity):
-                if data['gen1'] < 0 or data['gen2'] < 0:
-                    return 'Generation bids cannot be negative!'
-                if data['gen1'] + data['gen2'] > capacity:
-                    return 'Sum of generation bids cannot be higher than limit.'
-            '''
+            # the limits below belong to this period, the bid is only filed if it is still open on submit
+            bidRound, period = game.round, game.period
             if role['Fuel'] in ['wind', 'solar']:
-                capacity = renewBidLimit[str(roleID)]
+                capacity = game.renewBidLimit[str(roleID)]
             else:
                 capacity = role['Capacity (MW)']
-            # bid made in each period by each generator
-            bidPrice = input(f'Period {period} Bid Price ($/MW) for {capacity} MW capacity', type=NUMBER, placeholder='0')
-            bidExist = False
-            if period > 4:
-                bidExist = True
-            else:
-                for b in bids_period[period]:
-                    if b.id == roleID:
-                        bidExist = True
-            if not bidExist:
-                bids_period[period].append(bid(capacity, bidPrice, role['Location'], roleID))
-            periodBid_submitted[roleID - 1] = True
-            '''
-            bid = input_group("Make Generation Bids (Segment1+Segmeng2=capacity)",[
-                input('Generation Segment1 (MW)', name='gen1', type=NUMBER),
-                input('Bid Price for Segment1 ($/MW)', name='price1', type=NUMBER),
-                input('Generation Segment2 (MW)', name='gen2', type=NUMBER),
-                input('Bid Price for Segment2 ($/MW)', name='price2', type=NUMBER)
-            ], validate=partial(check_bid,capacity=capacity))
-            '''
-# clear thge market using by solving the dispatch problem
-def clearMarket(roles):
-    global bids_period, dispatchRes
-    for i in range(1, 7):
-        # for roles not taken by real players, submit bids based on cost
-        if not periodBid_submitted[i - 1]:
-            role = roles[str(i)]
-            if role['Fuel'] in ['wind', 'solar']:
-                bidGen = renewBidLimit[str(i)]
-                bidPrice = -renewCredit + 10
-                if role['Fuel'] == 'solar':
-                    print(bidGen)
-            else:
-                bidGen = role['Capacity (MW)']
-                bidPrice = role['Generation Cost ($/MWh)'] + random.randint(0, int(0.2 * role['Generation Cost ($/MWh)']))
-            bids_period[period].append(bid(bidGen, bidPrice, role['Location'], i))
-    genSol, lmp = gridDispatch(bids_period[period], [loadProfile[0][period - 1], loadProfile[1][period - 1]], transLimit[round])
-    for gen in genSol:
-        dispatchRes[gen[0]].append(gen[1])
-    clearingPrice.append(lmp)
-    # calculate accumulated revenue and profit for each generator
-    for i in range(1, 7):
-        role = roles[str(i)]
-        lmp = clearingPrice[period - 1][role['Location']]
-        if role['Fuel'] in ['wind', 'solar']:
-            revenue[i][period - 1] += (lmp + renewCredit) * dispatchRes[i][period - 1]
-            profit[i][period - 1] += (lmp + renewCredit - role['Generation Cost ($/MWh)']) * dispatchRes[i][period - 1]
-            if period >= 2:
-                revenue[i][period - 1] += revenue[i][period - 2]
-                profit[i][period - 1] += profit[i][period - 2]
-        else:
-            if role['Fuel'] == 'coal':
-                if dispatchRes[i][period - 1] == 0:
-                    profit[i][period - 1] -= role['Not-dispatched Penalty (per period)']
-            revenue[i][period - 1] += lmp * dispatchRes[i][period - 1]
-            profit[i][period - 1] += (lmp - role['Generation Cost ($/MWh)']) * dispatchRes[i][period - 1]
-            if period >= 2:
-                revenue[i][period - 1] += revenue[i][period - 2]
-                profit[i][period - 1] += profit[i][period - 2]
-
-            
+            # bid curve made in each period by each generator, segments left at 0 MW are not offered
+            inputs = []
+            for k in range(1, bidSegments + 1):
+                inputs.append(input(f'Generation Segment{k} (MW)', name=f'gen{k}', type=NUMBER, value=capacity if k == 1 else 0))
+                inputs.append(input(f'Bid Price for Segment{k} ($/MW)', name=f'price{k}', type=NUMBER, placeholder='0'))
+            bid = await input_group(f'Period {period} Generation Bids (sum of segments <= {capacity} MW)', inputs, validate=partial(check_bid, capacity=capacity))
+            segments = [(bid[f'gen{k}'] or 0, bid[f'price{k}'] or 0) for k in range(1, bidSegments + 1)]
+            if not game.submitBid(roleID, segments, period, bidRound):
+                toast(f'The market was cleared before your bid was submitted, period {period} is closed. Please bid for the new period.', color='warn')
 
-def control(choice, roles):
+@metrics.timed()
+def control(choice, game):
     if choice == 'View Market Information':
-        showMarketInfo(roles)
+        showMarketInfo(game)
     elif choice == 'View Market Results':
-        showMarketRes(roles)
+        showMarketRes(game)
 
-def control_GM(choice, roles):
-    global round, period, renewBidLimit, dispatchRes, clearingPrice, periodBid_submitted, bids_period, revenue, profit, roleID_gameID
+@metrics.timed()
+def control_GM(choice, game):
     if choice == 'View Market Information':
-        showMarketInfo(roles)
+        showMarketInfo(game)
     elif choice == 'Clear Market':
-        if period <= 4:
-            clearMarket(roles)
-            # set bid limit for renewable generators in the next period
-            # the bid limit can be regarded as actual generation that differs from forecast
-            if period <= 3:
-                for i in range(1, 7):
-                    role = roles[str(i)]
-                    if role['Fuel'] == 'wind':
-                        renewBidLimit[str(i)] = int(role['Nameplate Capacity (Maximum possible generation MW)'] * windProfile[period] * np.random.normal(1, 0.1))
-                    elif role['Fuel'] == 'solar':
-                        renewBidLimit[str(i)] = int(role['Nameplate Capacity (Maximum possible generation MW)'] * solarProfile[period] * np.random.normal(1, 0.1))
-                    periodBid_submitted[i - 1] = False
-            period += 1
-            showMarketRes(roles)
+        if game.period <= game.numPeriods:
+            game.clearMarket()
+            showMarketRes(game)
         else:
             toast('You have reached the final period. Please view market results and Wait until next round.')
+    elif choice == 'Price Sensitivity':
+        showSensitivity(game)
 
     elif choice == 'Move to Next Round':
-        if round == 1:
+        if game.round == 1:
             clear('market')
-            # reset the states
-            period = 1
-            roleID_gameID = {}
-            periodBid_submitted = [False for i in range(0, 6)]
-            bids_period = {
-                1: [],
-                2: [],
-                3: [],
-                4: []
-            }
-            clearingPrice = []
-            # initialize the information for period 1
-            for i in range(1, 7):
-                role = roles[str(i)]
-                if role['Fuel'] == 'wind':
-                    renewBidLimit[str(i)] = int(role['Nameplate Capacity (Maximum possible generation MW)'] * windProfile[period - 1] * np.random.normal(1, 0.1))
-                elif role['Fuel'] == 'solar':
-                    renewBidLimit[str(i)] = int(role['Nameplate Capacity (Maximum possible generation MW)'] * solarProfile[period - 1] * np.random.normal(1, 0.1))
-                dispatchRes[i] = []
-                revenue[i] = [0, 0, 0, 0]
-                profit[i] = [0, 0, 0, 0]
-            round = 2
+            game.nextRound()
 
 def checkID(id):
     if (not id in range(1, 7)) and (not id == 1000):
@@ -349,68 +234,100 @@ def makeRoleCard(role):
                     put_text(f'{attrib}: {locIdx_name[role[attrib]]}')
                 else:
                     put_text(f'{attrib}: {role[attrib]}')
-        img = open('./map.png', 'rb').read()  
-        put_image(img, width='200px')
+        put_image(mapImage, width='200px')
 
-def main():
-    global roleID_gameID, dispatchRes, period, revenue, profit
-    roles = json.load(open('./generators.json'))
-    id = input('Please input your game ID', type=NUMBER, required=True, validate=checkID)
+async def waitChange(game):
+    # player sessions spend most of their life here, between two clears
+    metrics.add('sleeping_sessions', 1)
+    try:
+        await game.waitChange()
+    finally:
+        metrics.add('sleeping_sessions', -1)
+
+# coroutine-based session: all player sessions share one event loop and sleep until their game changes
+async def main():
+    metrics.inc('sessions_total')
+    metrics.add('active_sessions', 1)
+    # counted until the page is closed, the game master session outlives play() to serve its buttons
+    defer_call(lambda: metrics.add('active_sessions', -1))
+    await play()
+
+async def play():
+    code = await input('Please input your room code', type=TEXT, required=True)
+    game = getGame(code, roles, dispatchBackend, history, checkpoint, clearingMode)
+    game.policies.update(botPolicies)
+    id = await input('Please input your game ID', type=NUMBER, required=True, validate=checkID)
     # game master interface
     if id == 1000:
-        if round == 1:
-            # initialize the information for period 1
-            # NOTE: game master enters the game first
-            for i in range(1, 7):
-                role = roles[str(i)]
-                if role['Fuel'] == 'wind':
-                    renewBidLimit[str(i)] = int(role['Nameplate Capacity (Maximum possible generation MW)'] * windProfile[period - 1] * np.random.normal(1, 0.1))
-                elif role['Fuel'] == 'solar':
-                    renewBidLimit[str(i)] = int(role['Nameplate Capacity (Maximum possible generation MW)'] * solarProfile[period - 1] * np.random.normal(1, 0.1))
-                dispatchRes[i] = []
-                revenue[i] = [0, 0, 0, 0]
-                profit[i] = [0, 0, 0, 0]
-                period = 1
         put_text(roleDescription[3])
-        put_buttons(['View Market Information', 'Clear Market', 'Move to Next Round'], onclick=partial(control_GM, roles=roles))
+        put_buttons(['View Market Information', 'Clear Market', 'Price Sensitivity', 'Move to Next Round'], onclick=partial(control_GM, game=game))
     # player interface
     else:
-        while round <= 2:
-            round_copy = round
+        while game.round <= 2:
+            round_copy = game.round
             # set real player flag that indicates whether a role is played by real player
-            roleID = gameID_role[id][f'round {round}']
-            # map the role ID to game ID
-            roleID_gameID[roleID] = id
-            #print(roleID_gameID)
-            roleByRealPlayer[roleID - 1] = True
-            role = roles[str(roleID)]
+            roleID = game.joinPlayer(id)
+            role = game.roles[str(roleID)]
             makeRoleCard(role)
             with use_scope('control', clear=True):
-                put_buttons(['View Market Information', 'View Market Results'], onclick=partial(control, roles=roles))
-                put_button('Make Bid', onclick=partial(showBidForm, role=role, roleID=roleID))
-            while period <= 4 and round_copy == round:
-                period_copy = period
+                put_buttons(['View Market Information', 'View Market Results'], onclick=partial(control, game=game))
+                put_button('Make Bid', onclick=partial(showBidForm, game=game, role=role, roleID=roleID))
+            while game.period <= game.numPeriods and round_copy == game.round:
+                period = game.period
                 with use_scope('info', clear=True):
-                    put_text(f'Round: {round}, Market Period: {period}')
-                    print(revenue[roleID][period - 1], profit[roleID][period - 1])
-                    put_text(f'Accumulated Revenue ($): {revenue[roleID][period - 2] if period >= 2 else 0}, Accumulated Profit ($): {profit[roleID][period - 2] if period >= 2 else 0}')
-                    if period >= 2:
-                        avgProfit = int(profit[roleID][period - 2] / sum(dispatchRes[roleID][:period-1]) if sum(dispatchRes[roleID][:period-1]) != 0 else 0)
-                    else:
-                        avgProfit = 0
-                    put_text(f'Average Profit ($/MW): {avgProfit}')
+                    put_text(f'Round: {game.round}, Market Period: {period}')
+                    ledger = game.ledger
+                    put_text(f'Accumulated Revenue ($): {ledger.accumRevenueOf(roleID, period - 1)}, Accumulated Profit ($): {ledger.accumProfitOf(roleID, period - 1)}')
+                    put_text(f'Average Profit ($/MW): {ledger.avgProfit(roleID, period - 1)}')
                     if role['Fuel'] in ['wind', 'solar']:
-                        capacity = renewBidLimit[str(roleID)]
+                        capacity = game.renewBidLimit[str(roleID)]
                         put_text(f'Generation Limit in this period: {capacity} MW')
-                
-                while period_copy == period and round_copy == round:
-                    time.sleep(0.2)
-            while round_copy == round:
-                time.sleep(0.2)
+
+                await waitChange(game)
+            while round_copy == game.round:
+                await waitChange(game)
             
 
 
+metrics.collect('games', lambda: len(games))
+metrics.collect('render_cache_hits_total', lambda: renderCache.hits, 'counter')
+metrics.collect('render_cache_misses_total', lambda: renderCache.misses, 'counter')
+metrics.collect('dispatch_cache_hits_total', lambda: dispatchCache.hits, 'counter')
+metrics.collect('dispatch_cache_misses_total', lambda: dispatchCache.misses, 'counter')
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics.render())
+
+def serve(port, host='localhost'):
+    # the routes of start_server plus /metrics, served on the same port
+    app = tornado.web.Application([
+        (r'/metrics', MetricsHandler),
+        (r'/plotly/(.*)', tornado.web.StaticFileHandler, {'path': charts.plotlyDir}),
+        (r'/', webio_handler(main, cdn=False)),
+        (r'/(.*)', tornado.web.StaticFileHandler, {'path': STATIC_PATH, 'default_filename': 'index.html'})
+    ], websocket_ping_interval=30, websocket_max_message_size=2 ** 20 * 200)
+    app.listen(int(port), address=host, max_buffer_size=2 ** 20 * 200)
+    print(f'Running on http://{host}:{port}/, metrics on http://{host}:{port}/metrics')
+    tornado.ioloop.IOLoop.current().start()
+
 if __name__ == '__main__':
     portID = sys.argv[1]
+    if len(sys.argv) > 2:
+        dispatchBackend = sys.argv[2]
+    if len(sys.argv) > 3:
+        clearingMode = sys.argv[3]
+    try:
+        checkClearing(clearingMode)
+    except (ValueError, ImportError) as e:
+        sys.exit(f'Cannot start the game server: {e}')
     test = True
-    start_server(main, port=portID, host='localhost')
\ No newline at end of file
+    if not test:
+        history = GameHistory('./gameHistory.db')
+    checkpoint = Checkpointer('./checkpoints')
+    restoreGames(checkpoint, history)
+    if len(sys.argv) > 4:
+        # dump a cProfile of every instrumented call slower than this many seconds to ./slowCalls
+        metrics.profileThreshold = float(sys.argv[4])
+    serve(portID)
\ No newline at end of file
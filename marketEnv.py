@@ -0,0 +1,54 @@
+import numpy as np
+from gameSession import observation, loadProfile, transLimit, renewCredit
+from gridDispatch import batchDispatch
+from ledger import SettlementLedger
+from scenarios import drawScenarios
+
+# gym-style environment of B independent markets stepped together, one episode is the periods of one round
+# every role offers its whole capacity (renewables their drawn generation) and the action is the bid price
+# of every role, so agents and bots are mixed by filling the columns of the action from different sources
+class MarketEnv:
+    def __init__(self, roles, batchSize, round=1, seed=None, loads=loadProfile, limits=transLimit):
+        self.roles = roles
+        self.roleIDs = sorted(int(i) for i in roles.keys())
+        self.batchSize = batchSize
+        self.loc = np.array([roles[str(i)]['Location'] for i in self.roleIDs])
+        self.transLimit = np.full(batchSize, float(limits[round]))
+        self.periodLoads = np.array([[loads[0][t], loads[1][t]] for t in range(len(loads[0]))], dtype=float)
+        self.periods = len(self.periodLoads)
+        self.ledger = SettlementLedger(roles, renewCredit)
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        # renewable generation and bot markups of the whole episode are drawn at once, like scenarios.py
+        self.maxGen, self.botCost = drawScenarios(self.roles, self.batchSize, self.rng)
+        self.maxGen = self.maxGen[:, :self.periods]
+        self.botCost = self.botCost[:, :self.periods]
+        self.t = 0
+        self.lastLmp = np.zeros((self.batchSize, 2))
+        return self.observe()
+
+    def observe(self):
+        return observation(np.full(self.batchSize, self.t + 1), np.broadcast_to(self.periodLoads[self.t], (self.batchSize, 2)), self.transLimit, self.lastLmp, self.maxGen[:, self.t])
+
+    def botPrices(self):
+        # bid prices of the rule-based bots of GameSession.clearMarket in the current period (B x roles)
+        return self.botCost[:, self.t].copy()
+
+    def step(self, prices):
+        # prices is (B x roles) in the order of the role IDs, returns the next observation, the profit of
+        # every role as reward (B x roles), whether the episode ended, and the clearing results
+        # markets whose bids cannot meet the load get no prices, zero reward and feasible=False
+        # at the end of an episode the environment resets itself and returns the first observation of the next one
+        prices = np.broadcast_to(np.asarray(prices, dtype=float), self.maxGen[:, self.t].shape)
+        gen, lmp = batchDispatch(self.maxGen[:, self.t], prices, self.loc, np.broadcast_to(self.periodLoads[self.t], (self.batchSize, 2)), self.transLimit)
+        _, _, profit, _, _ = self.ledger.settlement(gen, lmp)
+        feasible = ~np.isnan(lmp).any(axis=1)
+        info = {'lmp': lmp, 'dispatch': gen, 'feasible': feasible}
+        reward = np.where(feasible[:, None], profit, 0)
+        self.lastLmp = np.nan_to_num(lmp)
+        self.t += 1
+        done = self.t == self.periods
+        obs = self.reset() if done else self.observe()
+        return obs, reward, done, info
@@ -0,0 +1,113 @@
+import asyncio
+import cProfile
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+
+# upper bounds (seconds) of the call duration histograms
+buckets = [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# timings, counters and gauges of the game server, exported in the Prometheus text format
+class Metrics:
+    def __init__(self, prefix='powermarket'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        # call durations by function name: count, sum, max and the cumulative bucket counts
+        self.calls = defaultdict(lambda: {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(buckets)})
+        self.counters = defaultdict(float)
+        self.gauges = defaultdict(float)
+        # gauges read when the metrics are scraped, e.g. the hit counts kept by the caches
+        self.collectors = {}
+        # calls slower than profileThreshold (seconds) have their cProfile stats dumped to profileDir, None disables it
+        self.profileThreshold = None
+        self.profileDir = './slowCalls'
+        self.local = threading.local()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            call = self.calls[name]
+            call['count'] += 1
+            call['sum'] += seconds
+            call['max'] = max(call['max'], seconds)
+            for i, bound in enumerate(buckets):
+                if seconds <= bound:
+                    call['buckets'][i] += 1
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def add(self, name, value):
+        with self.lock:
+            self.gauges[name] += value
+
+    def collect(self, name, read, kind='gauge'):
+        self.collectors[name] = (read, kind)
+
+    def timed(self, name=None):
+        # decorator recording the duration of every call, for plain and coroutine functions
+        def decorator(fn):
+            label = name or fn.__qualname__
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.observe(label, time.perf_counter() - start)
+                return wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                # only the outermost timed call of a thread is profiled, cProfile cannot be nested
+                profiler = None
+                if self.profileThreshold is not None and not getattr(self.local, 'profiling', False):
+                    profiler = cProfile.Profile()
+                    self.local.profiling = True
+                    profiler.enable()
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    seconds = time.perf_counter() - start
+                    if profiler is not None:
+                        profiler.disable()
+                        self.local.profiling = False
+                        if seconds > self.profileThreshold:
+                            self.dump(label, profiler)
+                    self.observe(label, seconds)
+            return wrapper
+        return decorator
+
+    def dump(self, label, profiler):
+        os.makedirs(self.profileDir, exist_ok=True)
+        path = os.path.join(self.profileDir, f'{label}-{time.strftime("%Y%m%d-%H%M%S")}-{time.perf_counter_ns() % 10 ** 6}.prof')
+        profiler.dump_stats(path)
+        self.inc('slow_calls_total')
+
+    def render(self):
+        p = self.prefix
+        lines = [f'# HELP {p}_call_seconds Duration of the instrumented calls.', f'# TYPE {p}_call_seconds histogram']
+        with self.lock:
+            for label, call in sorted(self.calls.items()):
+                for bound, count in zip(buckets, call['buckets']):
+                    lines.append(f'{p}_call_seconds_bucket{{fn="{label}",le="{bound}"}} {count}')
+                lines.append(f'{p}_call_seconds_bucket{{fn="{label}",le="+Inf"}} {call["count"]}')
+                lines.append(f'{p}_call_seconds_sum{{fn="{label}"}} {call["sum"]}')
+                lines.append(f'{p}_call_seconds_count{{fn="{label}"}} {call["count"]}')
+            lines.append(f'# TYPE {p}_call_seconds_max gauge')
+            for label, call in sorted(self.calls.items()):
+                lines.append(f'{p}_call_seconds_max{{fn="{label}"}} {call["max"]}')
+            for name, value in sorted(self.counters.items()):
+                lines += [f'# TYPE {p}_{name} counter', f'{p}_{name} {value}']
+            values = {name: (value, 'gauge') for name, value in self.gauges.items()}
+        for name, (read, kind) in self.collectors.items():
+            values[name] = (read(), kind)
+        for name, (value, kind) in sorted(values.items()):
+            lines += [f'# TYPE {p}_{name} {kind}', f'{p}_{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
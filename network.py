@@ -0,0 +1,101 @@
+import json
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+from bidBook import asBidBook
+from metrics import metrics
+
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:
+    gp = None
+
+# DC power flow network: buses, lines with reactances and limits, and the shift factors (PTDF) of every line
+# PTDF[l, b] is the flow on line l caused by injecting 1 MW at bus b and withdrawing it at the slack bus
+class Network:
+    def __init__(self, buses, lines, slack=0):
+        self.busName = list(buses)
+        self.busNum = len(self.busName)
+        self.slack = slack
+        self.lineName = [line.get('name', f'line_{i}') for i, line in enumerate(lines)]
+        self.lineFrom = np.array([line['from'] for line in lines], dtype=int)
+        self.lineTo = np.array([line['to'] for line in lines], dtype=int)
+        self.reactance = np.array([line['reactance'] for line in lines], dtype=float)
+        # lines without a limit are not monitored
+        self.limit = np.array([line.get('limit', np.inf) for line in lines], dtype=float)
+        self.ptdf = self.computePTDF()
+
+    @classmethod
+    def load(cls, path='./network.json'):
+        config = json.load(open(path))
+        return cls(config['buses'], config['lines'], config.get('slack', 0))
+
+    def computePTDF(self):
+        lineNum = len(self.lineFrom)
+        rows = np.concatenate([np.arange(lineNum), np.arange(lineNum)])
+        cols = np.concatenate([self.lineFrom, self.lineTo])
+        vals = np.concatenate([np.ones(lineNum), -np.ones(lineNum)])
+        # branch-bus incidence and the nodal susceptance matrix, both kept sparse
+        incidence = sp.csc_matrix((vals, (rows, cols)), shape=(lineNum, self.busNum))
+        branchB = sp.diags(1 / self.reactance) @ incidence
+        busB = (incidence.T @ branchB).tocsc()
+        keep = np.array([b for b in range(self.busNum) if b != self.slack])
+        lu = splu(busB[keep][:, keep].tocsc())
+        # solve with the transposed factor instead of inverting the susceptance matrix
+        shift = lu.solve(branchB[:, keep].T.toarray(), trans='T').T
+        ptdf = np.zeros((lineNum, self.busNum))
+        ptdf[:, keep] = shift
+        ptdf[np.abs(ptdf) < 1e-10] = 0
+        return sp.csr_matrix(ptdf)
+
+    def isTwoBus(self):
+        return self.busNum == 2 and len(self.lineFrom) == 1
+
+@metrics.timed()
+def networkDispatch(bids, loads, network, backend='highs'):
+    # DC-OPF in shift-factor form: one power balance plus two flow limits per monitored line
+    # returns the same genSol as gridDispatch and one LMP per bus
+    bids = asBidBook(bids)
+    loads = np.asarray(loads, dtype=float)
+    genNum = len(bids)
+    busGen = sp.csr_matrix((np.ones(genNum), (bids.loc, np.arange(genNum))), shape=(network.busNum, genNum))
+    monitored = np.flatnonzero(np.isfinite(network.limit))
+    ptdf = network.ptdf[monitored]
+    flowGen = (ptdf @ busGen).tocsr()
+    baseFlow = ptdf @ loads
+    limit = network.limit[monitored]
+    aUb = sp.vstack([flowGen, -flowGen]).tocsr()
+    bUb = np.concatenate([limit + baseFlow, limit - baseFlow])
+    if backend == 'highs':
+        # scipy.optimize is slow to import and only needed once a network game clears
+        from scipy.optimize import linprog
+        res = linprog(bids.price, A_ub=aUb if len(monitored) else None, b_ub=bUb if len(monitored) else None,
+                      A_eq=np.ones((1, genNum)), b_eq=[loads.sum()], bounds=np.column_stack([np.zeros(genNum), bids.amount]), method='highs')
+        if res.status != 0:
+            raise ValueError('Bids are not enough to meet the load.')
+        gen = res.x
+        energyPrice = res.eqlin.marginals[0]
+        congestion = res.ineqlin.marginals if len(monitored) else np.zeros(0)
+    elif backend == 'gurobi':
+        if gp is None:
+            raise ImportError('gurobipy is required for the gurobi dispatch backend.')
+        from gridDispatch import getEnv
+        m = gp.Model('networkDispatch', env=getEnv())
+        g = m.addMVar(genNum, lb=0, ub=bids.amount)
+        balance = m.addConstr(np.ones(genNum) @ g == loads.sum())
+        flows = m.addConstr(aUb @ g <= bUb) if len(monitored) else None
+        m.setObjective(bids.price @ g, GRB.MINIMIZE)
+        m.optimize()
+        if m.Status != GRB.OPTIMAL:
+            raise ValueError('Bids are not enough to meet the load.')
+        gen = g.X
+        energyPrice = balance.Pi
+        congestion = flows.Pi if flows is not None else np.zeros(0)
+    else:
+        raise ValueError(f'Unknown network dispatch backend: {backend}')
+    # LMP = energy price + shift factors weighted by the duals of the binding flow limits
+    muUp, muDown = congestion[:len(monitored)], congestion[len(monitored):]
+    lmp = energyPrice + ptdf.T @ (muUp - muDown)
+    genSol = [(int(bids.role[i]), float(gen[i])) for i in range(genNum)]
+    return genSol, lmp.tolist()
@@ -0,0 +1,96 @@
+import numpy as np
+from bidBook import asBidBook
+from gridDispatch import tol
+
+# LMPs of one bid book as piecewise-constant functions of a load or of the line limit
+# everything is read from the book's merit order, sorted once, so a sweep costs a few searchsorted calls
+class MeritCurves:
+    def __init__(self, bids):
+        bids = asBidBook(bids)
+        order = bids.sortedIdx()
+        self.price = bids.price[order]
+        amount = bids.amount[order]
+        self.accumAll = np.concatenate([[0], np.cumsum(amount)])
+        # accumulated amount of location-0 bids along the common merit order gives the copper-plate flow
+        self.accumLoc0 = np.concatenate([[0], np.cumsum(amount * (bids.loc[order] == 0))])
+        self.locPrice = {}
+        self.locAccum = {}
+        for l in [0, 1]:
+            locOrder = bids.locationIdx(l)
+            self.locPrice[l] = bids.price[locOrder]
+            self.locAccum[l] = np.concatenate([[0], np.cumsum(bids.amount[locOrder])])
+
+    def marginalPrice(self, price, accum, load):
+        # price of the bid carrying the last MW, nan when the bids cannot meet the load
+        k = np.searchsorted(accum[1:], load - tol, side='left')
+        lmp = np.where(k < len(price), price[np.minimum(k, len(price) - 1)] if len(price) else np.nan, np.nan)
+        return np.where((len(price) == 0) & (load <= tol), 0, lmp)
+
+    def flow(self, load0, load1):
+        # trans_01 of the copper-plate dispatch
+        return np.interp(load0 + load1, self.accumAll, self.accumLoc0) - load0
+
+    def lmp(self, load0, load1, transLimit):
+        # same rules as meritDispatch, evaluated for arrays of loads and limits at once, returns (points x 2)
+        load0, load1, transLimit = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (load0, load1, transLimit)])
+        price = self.marginalPrice(self.price, self.accumAll, load0 + load1)
+        lmp = np.stack([price, price], axis=-1)
+        trans_01 = self.flow(load0, load1)
+        congested = np.abs(trans_01) > transLimit + tol
+        limited = np.sign(trans_01) * transLimit
+        lmp[..., 0] = np.where(congested, self.marginalPrice(self.locPrice[0], self.locAccum[0], load0 + limited), lmp[..., 0])
+        lmp[..., 1] = np.where(congested, self.marginalPrice(self.locPrice[1], self.locAccum[1], load1 - limited), lmp[..., 1])
+        # a total load above every bid cannot be served by either location, and when one congested location
+        # cannot meet its net load the market does not clear at all, as meritDispatch raises
+        lmp[load0 + load1 > self.accumAll[-1] + tol] = np.nan
+        lmp[np.isnan(lmp).any(axis=-1)] = np.nan
+        return lmp
+
+    def loadBreakpoints(self, loads, transLimit, loc, lo, hi):
+        # loads where an LMP can jump while the load of loc moves over [lo, hi]
+        other = loads[1 - loc]
+        steps = self.accumAll - other
+        # the copper-plate flow is linear between price steps, so congestion starts where it crosses +-transLimit
+        x = np.unique(np.clip(np.concatenate([steps, [lo, hi]]), lo, hi))
+        loadPair = (x, other) if loc == 0 else (other, x)
+        f = self.flow(*loadPair)
+        onsets = []
+        for limit in [transLimit, -transLimit]:
+            d = f - limit
+            cross = np.flatnonzero(d[:-1] * d[1:] < 0)
+            onsets.append(x[cross] - d[cross] * (x[cross + 1] - x[cross]) / (d[cross + 1] - d[cross]))
+        # congested location prices step where the net load of loc (its load -+ transLimit) crosses one of its own bid steps
+        congestedSteps = [self.locAccum[loc] - transLimit, self.locAccum[loc] + transLimit]
+        candidates = np.concatenate([x] + onsets + congestedSteps)
+        return np.unique(candidates[(candidates >= lo) & (candidates <= hi)])
+
+    def limitBreakpoints(self, loads, lo, hi):
+        # limits where an LMP can jump: the copper-plate flow itself, and the limits that move a congested
+        # location's net load across one of its bid steps
+        trans_01 = float(self.flow(loads[0], loads[1]))
+        s = np.sign(trans_01) or 1
+        candidates = np.concatenate([[abs(trans_01), lo, hi], s * (self.locAccum[0] - loads[0]), s * (loads[1] - self.locAccum[1])])
+        return np.unique(candidates[(candidates >= lo) & (candidates <= hi)])
+
+def piecewise(x, evaluate):
+    # value of each segment [x_i, x_i+1) taken at its midpoint, the last point keeps its own value
+    mid = np.append((x[:-1] + x[1:]) / 2, x[-1])
+    lmp = evaluate(mid)
+    # keep only the points where the function actually changes
+    keep = np.concatenate([[True], np.any(~np.isclose(lmp[1:], lmp[:-1], equal_nan=True), axis=1)])
+    keep[-1] = True
+    return x[keep], lmp[keep]
+
+def lmpVsLoad(bids, loads, transLimit, loc, lo, hi):
+    # breakpoints of both LMPs when the load of loc moves over [lo, hi], with the LMPs right after each of them
+    curves = MeritCurves(bids)
+    x = curves.loadBreakpoints(loads, transLimit, loc, lo, hi)
+    if loc == 0:
+        return piecewise(x, lambda v: curves.lmp(v, loads[1], transLimit))
+    return piecewise(x, lambda v: curves.lmp(loads[0], v, transLimit))
+
+def lmpVsLimit(bids, loads, lo, hi):
+    # breakpoints of both LMPs when the line limit moves over [lo, hi]
+    curves = MeritCurves(bids)
+    x = curves.limitBreakpoints(loads, lo, hi)
+    return piecewise(x, lambda v: curves.lmp(loads[0], loads[1], v))
@@ -0,0 +1,75 @@
+import csv
+from itertools import islice
+import numpy as np
+
+# renewable capacity factors and the load of every location for each period of a round
+# .npy files hold one row per period with the columns wind, solar and the load of each bus, and are
+# memory-mapped so that a year of hourly data is only read as it is used; .csv files have a header
+# row wind, solar and the bus names, and are read in chunks of rows
+class Profiles:
+    def __init__(self, wind, solar, load):
+        self.wind = wind
+        self.solar = solar
+        # periods x locations
+        self.load = load
+
+    @classmethod
+    def open(cls, path, busNames):
+        # profiles for a single pass over the horizon with chunks(): .npy files are memory-mapped and .csv files
+        # are streamed, so neither is held in memory at once
+        if path.endswith('.npy'):
+            return cls.load(path, busNames)
+        return CSVProfiles(path, busNames)
+
+    @classmethod
+    def load(cls, path, busNames, chunkSize=8760):
+        if path.endswith('.npy'):
+            data = np.load(path, mmap_mode='r')
+            return cls(data[:, 0], data[:, 1], data[:, 2:2 + len(busNames)])
+        chunks = [chunk for chunk in readCSV(path, busNames, chunkSize)]
+        return cls(*[np.concatenate([chunk[k] for chunk in chunks]) for k in range(3)])
+
+    def save(self, path):
+        # store as .npy so that the profiles can be memory-mapped next time
+        np.save(path, np.column_stack([self.wind, self.solar, self.load]))
+
+    @property
+    def periods(self):
+        return len(self.wind)
+
+    def loadProfile(self):
+        # load of each location indexed by the location ID, as used by GameSession
+        return {l: self.load[:, l] for l in range(self.load.shape[1])}
+
+    def chunks(self, chunkSize):
+        # consecutive slices of the horizon, views of the memory map when loaded from .npy
+        for start in range(0, self.periods, chunkSize):
+            end = min(start + chunkSize, self.periods)
+            yield start, Profiles(self.wind[start:end], self.solar[start:end], self.load[start:end])
+
+# .csv profiles read again from the file by every pass of chunks(), with the periods and chunks() of Profiles
+class CSVProfiles:
+    def __init__(self, path, busNames):
+        self.path = path
+        self.busNames = busNames
+        with open(path, newline='') as f:
+            # the header row is not a period
+            self.periods = sum(1 for _ in csv.reader(f)) - 1
+
+    def chunks(self, chunkSize):
+        start = 0
+        for wind, solar, load in readCSV(self.path, self.busNames, chunkSize):
+            yield start, Profiles(wind, solar, load)
+            start += len(wind)
+
+def readCSV(path, busNames, chunkSize):
+    # buses without a column in the file have no load; parsed with the csv module so that the game server
+    # does not import pandas at startup, float() rounds like pandas' round_trip
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        while True:
+            rows = list(islice(reader, chunkSize))
+            if not rows:
+                break
+            column = lambda name: np.array([float(row[name]) for row in rows]) if name in reader.fieldnames else np.zeros(len(rows))
+            yield column('wind'), column('solar'), np.column_stack([column(name) for name in busNames])
@@ -0,0 +1,29 @@
+import threading
+
+# rendered figures and tables keyed by (game, round, period, view)
+# the market only changes on a clear or a new round, so every session of a game shares one rendering
+class RenderCache:
+    def __init__(self):
+        self.fragments = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, render):
+        with self.lock:
+            if key in self.fragments:
+                self.hits += 1
+                return self.fragments[key]
+            self.misses += 1
+        fragment = render()
+        with self.lock:
+            self.fragments[key] = fragment
+        return fragment
+
+    def invalidate(self, code):
+        # drop every fragment of one game
+        with self.lock:
+            for key in [key for key in self.fragments if key[0] == code]:
+                del self.fragments[key]
+
+renderCache = RenderCache()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import sys
+import numpy as np
+from gameSession import network, renewCredit
+from gridDispatch import batchDispatch
+from network import networkDispatch
+from bidBook import BidBook
+from ledger import SettlementLedger
+from profiles import Profiles
+from scenarios import drawScenarios
+from simulate import summarize
+
+# replay a long horizon (e.g. a year of hourly ISO data) through the market with every role bid by the bots
+# the horizon is cleared and settled chunk by chunk, so memory is bounded by the chunk size and not by its length
+def clearChunk(maxGen, cost, loc, loads, transLimit):
+    if network.isTwoBus():
+        return batchDispatch(maxGen, cost, loc, loads, transLimit)
+    # larger grids are cleared period by period with the DC-OPF
+    gen = np.full(maxGen.shape, np.nan)
+    lmp = np.full((len(maxGen), network.busNum), np.nan)
+    for t in range(len(maxGen)):
+        book = BidBook(len(loc))
+        for j in range(len(loc)):
+            book.add(maxGen[t, j], cost[t, j], loc[j], j + 1)
+        try:
+            genSol, lmp[t] = networkDispatch(book, loads[t], network)
+            gen[t] = [g for _, g in genSol]
+        except ValueError:
+            pass
+    return gen, lmp
+
+def replay(roles, profiles, transLimit, chunkSize=744, seed=None, out=None):
+    rng = np.random.default_rng(seed)
+    roleIDs = sorted(roles.keys(), key=int)
+    loc = np.array([roles[i]['Location'] for i in roleIDs])
+    ledger = SettlementLedger(roles, renewCredit, locNum=network.busNum)
+    # per-period LMPs are only kept on disk, as a memory-mapped .npy file, when an output path is given
+    lmpOut = np.lib.format.open_memmap(out, mode='w+', shape=(profiles.periods, network.busNum)) if out else None
+    profit = np.zeros(len(roleIDs))
+    dispatch = np.zeros(len(roleIDs))
+    lmpSum = np.zeros(network.busNum)
+    lmpChunks = []
+    congested = 0
+    infeasible = 0
+    for start, chunk in profiles.chunks(chunkSize):
+        maxGen, cost = drawScenarios(roles, 1, rng, chunk.wind, chunk.solar)
+        gen, lmp = clearChunk(maxGen[0], cost[0], loc, np.asarray(chunk.load, dtype=float), transLimit)
+        _, _, chunkProfit, _, _ = ledger.settlement(gen, lmp)
+        feasible = ~np.isnan(lmp).any(axis=1)
+        profit += chunkProfit[feasible].sum(axis=0)
+        dispatch += gen[feasible].sum(axis=0)
+        lmpSum += lmp[feasible].sum(axis=0)
+        congested += int((np.ptp(lmp[feasible], axis=1) > 1e-6).sum())
+        infeasible += int((~feasible).sum())
+        # a few percentiles per chunk are enough for the distribution summary
+        lmpChunks.append(np.percentile(lmp[feasible], [5, 50, 95], axis=0) if feasible.any() else np.full((3, network.busNum), np.nan))
+        if lmpOut is not None:
+            lmpOut[start:start + len(lmp)] = lmp
+    if lmpOut is not None:
+        lmpOut.flush()
+    served = profiles.periods - infeasible
+    return {
+        'periods': profiles.periods,
+        'infeasible': infeasible,
+        'congestionFrequency': congested / max(served, 1),
+        'averageLmp': {name: lmpSum[l] / max(served, 1) for l, name in enumerate(network.busName)},
+        'chunkLmp': {name: summarize(np.array(lmpChunks)[:, :, l]) for l, name in enumerate(network.busName)},
+        'profit': {roleID: profit[j] for j, roleID in enumerate(roleIDs)},
+        'dispatch': {roleID: dispatch[j] for j, roleID in enumerate(roleIDs)}
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay long renewable and load profiles through the market.')
+    parser.add_argument('--profiles', default='./profiles.csv', help='.csv with columns wind, solar and one per bus, or .npy with the same columns')
+    parser.add_argument('--trans-limit', type=float, default=200, help='transmission limit (MW)')
+    parser.add_argument('--chunk', type=int, default=744, help='number of periods cleared at once')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--lmp-out', help='.npy file to write the LMP of every period to')
+    parser.add_argument('--out', default='replayResults.json')
+    args = parser.parse_args()
+    roles = json.load(open('./generators.json'))
+    profiles = Profiles.open(args.profiles, network.busName)
+    summary = replay(roles, profiles, args.trans_limit, args.chunk, args.seed, args.lmp_out)
+    with open(args.out, 'w') as f:
+        json.dump(summary, f, indent=4)
+    print(f'{profiles.periods} periods replayed, results written to {args.out}', file=sys.stderr)
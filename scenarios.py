@@ -0,0 +1,66 @@
+import argparse
+import json
+import sys
+import numpy as np
+from gameSession import windProfile, solarProfile, loadProfile, transLimit, renewCredit
+from gridDispatch import batchDispatch
+from ledger import SettlementLedger
+from simulate import summarize
+
+# draw the renewable realizations and bot markups of n scenarios at once, with the same rules as GameSession
+# returns bid amounts and prices as (scenarios x periods x roles) arrays
+def drawScenarios(roles, n, rng, wind=windProfile, solar=solarProfile):
+    roleIDs = sorted(roles.keys(), key=int)
+    periods = len(wind)
+    maxGen = np.zeros((n, periods, len(roleIDs)))
+    cost = np.zeros((n, periods, len(roleIDs)))
+    for j, roleID in enumerate(roleIDs):
+        role = roles[roleID]
+        if role['Fuel'] in ['wind', 'solar']:
+            profile = np.asarray(wind if role['Fuel'] == 'wind' else solar)
+            maxGen[:, :, j] = (role['Nameplate Capacity (Maximum possible generation MW)'] * profile * rng.normal(1, 0.1, size=(n, periods))).astype(int)
+            cost[:, :, j] = -renewCredit + 10
+        else:
+            maxGen[:, :, j] = role['Capacity (MW)']
+            genCost = role['Generation Cost ($/MWh)']
+            cost[:, :, j] = genCost + rng.integers(0, int(0.2 * genCost), endpoint=True, size=(n, periods))
+    return maxGen, cost
+
+def runScenarios(roles, n, round=1, seed=None, loads=loadProfile, limits=transLimit):
+    maxGen, cost = drawScenarios(roles, n, np.random.default_rng(seed))
+    n, periods, roleNum = maxGen.shape
+    loc = np.array([roles[i]['Location'] for i in sorted(roles.keys(), key=int)])
+    periodLoads = np.array([[loads[0][t], loads[1][t]] for t in range(periods)])
+    # every (scenario, period) pair is an independent market, all of them are cleared in one batched pass
+    gen, lmp = batchDispatch(maxGen.reshape(-1, roleNum), cost.reshape(-1, roleNum), loc, np.tile(periodLoads, (n, 1)), limits[round])
+    gen = gen.reshape(n, periods, roleNum)
+    lmp = lmp.reshape(n, periods, 2)
+    _, revenue, profit, _, _ = SettlementLedger(roles, renewCredit).settlement(gen, lmp)
+    return lmp, gen, profit
+
+def summarizeScenarios(roles, lmp, profit):
+    # scenarios whose bids cannot meet the load have no prices and are left out of the distributions
+    feasible = ~np.isnan(lmp).any(axis=(1, 2))
+    lmp = lmp[feasible]
+    profit = profit[feasible]
+    roleIDs = sorted(roles.keys(), key=int)
+    return {
+        'scenarios': int(len(feasible)),
+        'infeasible': int((~feasible).sum()),
+        'lmp': {'South': summarize(lmp[:, :, 0]), 'North': summarize(lmp[:, :, 1])},
+        'profitPerPeriod': {roleID: summarize(profit[:, :, j]) for j, roleID in enumerate(roleIDs)},
+        'profit': {roleID: {k: v[j] for k, v in summarize(profit.sum(axis=1)).items()} for j, roleID in enumerate(roleIDs)}
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monte Carlo scenarios of renewable generation and bot markups.')
+    parser.add_argument('--scenarios', type=int, default=100000)
+    parser.add_argument('--round', type=int, default=1, choices=[1, 2])
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--out', default='scenarioResults.json')
+    args = parser.parse_args()
+    roles = json.load(open('./generators.json'))
+    lmp, gen, profit = runScenarios(roles, args.scenarios, args.round, args.seed)
+    with open(args.out, 'w') as f:
+        json.dump(summarizeScenarios(roles, lmp, profit), f, indent=4)
+    print(f'{args.scenarios} scenarios cleared, results written to {args.out}', file=sys.stderr)
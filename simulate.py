@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import sys
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from gameSession import GameSession, loadProfile, transLimit
+from gridDispatch import dispatchCache
+
+# play complete games without a browser: every role is bid by the bots of GameSession.clearMarket
+def playGame(seed, roles, loads, limits, backend):
+    game = GameSession(f'sim-{seed}', roles, backend=backend, seed=seed, loadProfile=loads, transLimit=limits)
+    result = {}
+    for r in [1, 2]:
+        while game.period <= game.numPeriods:
+            game.clearMarket()
+        ledger = game.ledger
+        result[r] = (ledger.clearingPrice[:ledger.periods].copy(), ledger.accumProfit[:, ledger.periods - 1].copy())
+        game.nextRound()
+    return result
+
+def playGames(seeds, roles, loads, limits, backend, cacheSize):
+    # one task per chunk of games so that the process pool is not dominated by pickling
+    dispatchCache.maxSize = cacheSize
+    hits, misses = dispatchCache.hits, dispatchCache.misses
+    results = [playGame(seed, roles, loads, limits, backend) for seed in seeds]
+    return results, dispatchCache.hits - hits, dispatchCache.misses - misses
+
+def summarize(values, axis=0):
+    return {
+        'mean': np.mean(values, axis=axis).tolist(),
+        'std': np.std(values, axis=axis).tolist(),
+        'p5': np.percentile(values, 5, axis=axis).tolist(),
+        'p50': np.percentile(values, 50, axis=axis).tolist(),
+        'p95': np.percentile(values, 95, axis=axis).tolist()
+    }
+
+def aggregate(results, roles):
+    summary = {}
+    for r in [1, 2]:
+        # lmp: games x periods x locations, profit: games x roles
+        lmp = np.array([res[r][0] for res in results])
+        profit = np.array([res[r][1] for res in results])
+        congested = np.abs(lmp[:, :, 0] - lmp[:, :, 1]) > 1e-6
+        summary[f'round {r}'] = {
+            'lmp': {'South': summarize(lmp[:, :, 0]), 'North': summarize(lmp[:, :, 1])},
+            'profit': {roleID: {k: v[i] for k, v in summarize(profit).items()} for i, roleID in enumerate(sorted(roles.keys(), key=int))},
+            'congestionFrequency': congested.mean(axis=0).tolist()
+        }
+    return summary
+
+def simulate(games, workers=None, seed=0, loadScale=1.0, limits=None, penalty=None, backend='merit', chunkSize=100, cacheSize=4096):
+    roles = json.load(open('./generators.json'))
+    if penalty is not None:
+        for role in roles.values():
+            if 'Not-dispatched Penalty (per period)' in role:
+                role['Not-dispatched Penalty (per period)'] = penalty
+    loads = {loc: [load * loadScale for load in profile] for loc, profile in loadProfile.items()}
+    limits = limits or transLimit
+    # SeedSequence keeps the per-game streams independent whatever the chunking is
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(games)]
+    chunks = [seeds[i:i + chunkSize] for i in range(0, games, chunkSize)]
+    results = []
+    hits = 0
+    misses = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk, chunkHits, chunkMisses in executor.map(partial(playGames, roles=roles, loads=loads, limits=limits, backend=backend, cacheSize=cacheSize), chunks):
+            results += chunk
+            hits += chunkHits
+            misses += chunkMisses
+    summary = aggregate(results, roles)
+    summary['dispatchCache'] = {'hits': hits, 'misses': misses, 'hitRate': hits / (hits + misses)}
+    summary['settings'] = {'games': games, 'seed': seed, 'loadScale': loadScale, 'transLimit': limits, 'penalty': penalty, 'backend': backend}
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run complete power market games without a browser.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--load-scale', type=float, default=1.0, help='multiplier applied to the load profile')
+    parser.add_argument('--trans-limit', type=float, nargs=2, metavar=('ROUND1', 'ROUND2'), help='transmission limit of each round (MW)')
+    parser.add_argument('--penalty', type=float, help='not-dispatched penalty (per period) of every unit that has one')
+    parser.add_argument('--backend', default='merit', choices=['merit', 'gurobi'])
+    parser.add_argument('--cache-size', type=int, default=4096, help='number of dispatch results kept by each worker')
+    parser.add_argument('--out', default='simResults.json')
+    args = parser.parse_args()
+    limits = {1: args.trans_limit[0], 2: args.trans_limit[1]} if args.trans_limit else None
+    summary = simulate(args.games, args.workers, args.seed, args.load_scale, limits, args.penalty, args.backend, cacheSize=args.cache_size)
+    with open(args.out, 'w') as f:
+        json.dump(summary, f, indent=4)
+    print(f'{args.games} games simulated, results written to {args.out}', file=sys.stderr)